@@ -0,0 +1,12 @@
+__author__ = 'jshoham'
+
+import sys
+from src import rw
+
+
+def main(*args):
+    rw.main(*args)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,58 @@
+__author__ = 'jshoham'
+
+# Counter
+# Counts the solutions of every puzzle in the given file (in any format the solver accepts), stopping at
+# settings.count_limit solutions per puzzle, using the same engine and settings as the solver. Writes the
+# count of each puzzle to <filename>'_counts.txt', and every puzzle with a unique solution (whose count
+# finished within the time limit) to <filename>'_unique.txt', so generated puzzles can be filtered for
+# uniqueness.
+
+
+import sys
+import os
+import rw
+import solver
+import settings
+
+
+def main(*args):
+    if len(args) != 1:
+        print "counter.py requires exactly 1 argument ({} given).".format(len(args))
+        exit(-1)
+
+    input_filepath = args[0]
+    root, ext = os.path.splitext(input_filepath)
+    if rw.is_packed_file(input_filepath):
+        puzzles = rw.PackedPuzzles(input_filepath)
+        ext = '.txt'  # the output files are text
+    else:
+        puzzles = rw.iter_puzzles(input_filepath)
+
+    counts_header = ('puzzle', 'solutions', 'timeout')
+    tally = {'unique': 0, 'multiple': 0, 'none': 0, 'timeout': 0}
+    with rw.open_output_file(root + '_counts' + ext) as counts_file, \
+            rw.open_output_file(root + '_unique' + ext) as unique_file:
+        counts_file.write('\t'.join(counts_header))
+        for pnum, board_str, count, timeout in solver.count_puzzles(puzzles):
+            entry = (pnum, count, timeout)
+            counts_file.write('\n' + '\t'.join(str(item).ljust(len(header))
+                                                for item, header in zip(entry, counts_header)))
+            if timeout:
+                tally['timeout'] += 1
+            elif count == 1:
+                if tally['unique']:
+                    unique_file.write('\n')
+                unique_file.write(board_str)
+                tally['unique'] += 1
+            elif count:
+                tally['multiple'] += 1
+            else:
+                tally['none'] += 1
+            print 'Puzzle {}: {}{} solution(s){}'.format(pnum, count, '+' if count == settings.count_limit > 1 else '',
+                                                           ' (timed out)' if timeout else '')
+
+    print 'Unique: {unique}, Multiple: {multiple}, No Solution: {none}, Timed Out: {timeout}'.format(**tally)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,236 @@
+__author__ = 'jshoham'
+
+# An exact cover search engine using Knuth's Dancing Links (Algorithm X).
+#
+# A puzzle is an exact cover problem: every cell must hold one token, and every row, column, and box must
+# hold every token exactly once. Each of these conditions is a column of the cover matrix, and each
+# candidate (a cell holding a token) is a matrix row which covers four columns: its cell, and the token
+# in its row, column, and box. A solution picks rows covering every column exactly once.
+#
+# The matrix is stored as circular doubly linked lists in flat lists of links. Node 0 is the root, nodes
+# 1 through the number of columns are the column headers, and the remaining nodes are the 1s of the matrix.
+
+
+import time
+
+
+class DancingLinks(object):
+    """The sparse cover matrix of an exact cover problem, searchable with Algorithm X."""
+
+    def __init__(self, column_count, rows):
+        """Builds the matrix with column_count columns numbered from 0, where rows is a list of lists of the
+        columns each row covers."""
+        headers = column_count + 1
+        self.L = [i - 1 for i in xrange(headers)]
+        self.R = [i + 1 for i in xrange(headers)]
+        self.L[0] = column_count
+        self.R[column_count] = 0
+        self.U = range(headers)
+        self.D = range(headers)
+        self.C = range(headers)  # the column header of each node
+        self.S = [0] * headers  # the number of nodes in each column
+        self.row_of = [-1] * headers  # the row number of each node
+
+        L, R, U, D, C, S, row_of = self.L, self.R, self.U, self.D, self.C, self.S, self.row_of
+        for row_number, columns in enumerate(rows):
+            first = len(C)
+            for column in columns:
+                c = column + 1
+                node = len(C)
+                C.append(c)
+                row_of.append(row_number)
+                # insert at the bottom of column c
+                U.append(U[c])
+                D.append(c)
+                D[U[c]] = node
+                U[c] = node
+                S[c] += 1
+                # insert at the end of the row
+                L.append(node - 1 if node > first else node)
+                R.append(first)
+                if node > first:
+                    R[node - 1] = node
+                    L[first] = node
+
+        self.selections = 0  # number of rows chosen over the course of the search
+        self.solutions = 0  # number of exact covers found by the search
+        self.timeout = False
+
+    def cover(self, c):
+        """Removes column c from the header list, and every row covering c from the other columns."""
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        L[R[c]] = L[c]
+        R[L[c]] = R[c]
+        i = D[c]
+        while i != c:
+            j = R[i]
+            while j != i:
+                U[D[j]] = U[j]
+                D[U[j]] = D[j]
+                S[C[j]] -= 1
+                j = R[j]
+            i = D[i]
+
+    def uncover(self, c):
+        """Exactly undoes cover(c)."""
+        L, R, U, D, C, S = self.L, self.R, self.U, self.D, self.C, self.S
+        i = U[c]
+        while i != c:
+            j = L[i]
+            while j != i:
+                S[C[j]] += 1
+                U[D[j]] = j
+                D[U[j]] = j
+                j = L[j]
+            i = U[i]
+        L[R[c]] = c
+        R[L[c]] = c
+
+    def choose_column(self):
+        """Returns the column with the fewest rows left (the MRV heuristic for exact cover)."""
+        R, S = self.R, self.S
+        best = c = R[0]
+        best_size = S[c]
+        while c and best_size > 1:
+            if S[c] < best_size:
+                best = c
+                best_size = S[c]
+            c = R[c]
+        return best
+
+    def search(self, time_limit=0, start_time=None, limit=1):
+        """Finds exact covers of the matrix, stopping at the limit-th one (0 finds them all).
+
+        The search keeps the chosen rows on an explicit stack rather than recursing. The number of covers
+        found is kept in solutions. Returns the list of row numbers of the first cover, or None if there is
+        no exact cover or the time limit (in seconds, zero for none) ran out first, in which case timeout is
+        set.
+        """
+        if not start_time:
+            start_time = time.clock()
+        R, D, C = self.R, self.D, self.C
+        chosen = []  # the node of each chosen row
+        first = None
+
+        while True:
+            if time_limit and time.clock() - start_time >= time_limit:
+                self.timeout = True
+                return first
+            if R[0] == 0:  # every column is covered
+                self.solutions += 1
+                if first is None:
+                    first = [self.row_of[node] for node in chosen]
+                if self.solutions == limit:
+                    return first
+                r = self._backtrack(chosen)  # carry on as if the last row had failed
+            else:
+                c = self.choose_column()
+                self.cover(c)
+                r = D[c]
+                if r == c:  # no row left to cover c
+                    self.uncover(c)
+                    r = self._backtrack(chosen)
+            if r is None:
+                return first
+
+            chosen.append(r)
+            self.selections += 1
+            j = R[r]
+            while j != r:
+                self.cover(C[j])
+                j = R[j]
+
+    def _backtrack(self, chosen):
+        """Removes the last chosen row, and returns the next row to try in its column. While the column has no
+        more rows, it is uncovered and the search backs up to the row chosen before. Returns None when every
+        choice has been exhausted."""
+        D, C, L = self.D, self.C, self.L
+        while chosen:
+            r = chosen.pop()
+            c = C[r]
+            j = L[r]
+            while j != r:
+                self.uncover(C[j])
+                j = L[j]
+            r = D[r]
+            if r != c:
+                return r
+            self.uncover(c)
+        return None
+
+
+def _cover_matrix(board):
+    """Returns the cover matrix of board as DancingLinks, along with the (row, col, value) candidate of each
+    of its rows.
+
+    Only the possible values of each empty cell are candidates, so values already removed from the domains
+    (by arc consistency pre-processing, for example) shrink the matrix. Tokens on the board are taken as
+    given: their columns are left out of the matrix, along with every candidate conflicting with them.
+    """
+    N, p, q = board.N, board.p, board.q
+    NN = N * N
+    # Column numbers: cell i, then (row, value), (col, value) and (box, value) pairs
+    satisfied = [False] * (4 * NN)
+    for i in xrange(NN):
+        value = board.tokens[i]
+        if value:
+            row, col = i // N, i % N
+            box = (row // p) * p + col // q
+            for column in (i, NN + row * N + value - 1, 2 * NN + col * N + value - 1, 3 * NN + box * N + value - 1):
+                satisfied[column] = True
+
+    column_numbers = [-1] * (4 * NN)
+    column_count = 0
+    for column in xrange(4 * NN):
+        if not satisfied[column]:
+            column_numbers[column] = column_count
+            column_count += 1
+
+    candidates = []
+    rows = []
+    for i in xrange(NN):
+        if board.tokens[i]:
+            continue
+        row, col = i // N, i % N
+        box = (row // p) * p + col // q
+        for value in board.possible_values(row, col):
+            columns = (i, NN + row * N + value - 1, 2 * NN + col * N + value - 1, 3 * NN + box * N + value - 1)
+            if any(satisfied[column] for column in columns):
+                continue
+            candidates.append((row, col, value))
+            rows.append([column_numbers[column] for column in columns])
+
+    return DancingLinks(column_count, rows), candidates
+
+
+def solve(board, time_limit=0, start_time=None):
+    """Solves board as an exact cover problem (see _cover_matrix), filling in its empty cells.
+
+    Returns the board if it was solved, or None if it has no solution or the time limit ran out, along with
+    the number of rows chosen during the search and whether the search timed out.
+    """
+    if not board.verify():
+        return None, 0, False
+
+    links, candidates = _cover_matrix(board)
+    solution = links.search(time_limit, start_time)
+    if solution is None:
+        return None, links.selections, links.timeout
+    for row_number in solution:
+        board.assign(*candidates[row_number])
+    return board, links.selections, False
+
+
+def count_solutions(board, limit=2, time_limit=0, start_time=None):
+    """Counts the solutions of board, stopping at limit of them (0 counts them all). The board is not
+    modified.
+
+    Returns the number of solutions found, the number of rows chosen during the search and whether the search
+    timed out.
+    """
+    if not board.verify():
+        return 0, 0, False
+
+    links = _cover_matrix(board)[0]
+    links.search(time_limit, start_time, limit)
+    return links.solutions, links.selections, links.timeout
@@ -1,11 +1,181 @@
 __author__ = 'jshoham'
 
+# Cell domains are stored as integer bitmasks, where bit v is set if v is still a possible value
+# for that cell. Bit 0 is never used, so a domain of {1, 3} is stored as 0b1010. Token values and
+# domains of all cells are kept in flat lists indexed by row * N + col.
+
+import itertools
+
+# Characters representing the tokens 1, 2, 3, ... in the inline representation of a puzzle (see
+# inline_dimensions). Blank cells are represented by '.' or '0', and letters may be in either case.
+TOKENS = '123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+TOKEN_VALUES = dict([(char, value) for value, char in enumerate(TOKENS, 1)] +
+                    [(char.lower(), value) for value, char in enumerate(TOKENS, 1)] +
+                    [('.', 0), ('0', 0)])
+
+
+def inline_dimensions(length):
+    """Returns the dimensions (N, p, q) of a puzzle whose inline representation is length characters
+    long, or None if there is no such puzzle.
+
+    The board has N = sqrt(length) rows. Its boxes are as close to square as possible, with no more
+    rows than columns: p is the largest divisor of N which is at most sqrt(N), and q = N / p. So a
+    line of 81 characters is a 9x9 puzzle with 3x3 boxes, and one of 144 characters is a 12x12 puzzle
+    with 3x4 boxes.
+    """
+    N = int(round(length ** 0.5))
+    if N < 1 or N * N != length or N > len(TOKENS):
+        return None
+    p = max(d for d in xrange(1, int(N ** 0.5) + 1) if N % d == 0)
+    return N, p, N // p
+
+
+# Number of bits set in each 16 bit integer, used to compute domain sizes from bitmasks
+_POPCOUNT16 = [0] * (1 << 16)
+for _mask in xrange(1, 1 << 16):
+    _POPCOUNT16[_mask] = _POPCOUNT16[_mask >> 1] + (_mask & 1)
+
+
+def popcount(mask):
+    """Returns the number of bits set in mask."""
+    count = 0
+    while mask:
+        count += _POPCOUNT16[mask & 0xffff]
+        mask >>= 16
+    return count
+
+
+def bit_indices(mask):
+    """Returns a sorted list of the positions of the bits set in mask."""
+    indices = []
+    while mask:
+        low_bit = mask & -mask
+        indices.append(low_bit.bit_length() - 1)
+        mask ^= low_bit
+    return indices
+
+
+def mask_values(mask):
+    """Returns a sorted list of the values whose bits are set in mask. Since value v is stored in bit v,
+    these are simply the positions of the set bits."""
+    return bit_indices(mask)
+
+
+class Geometry(object):
+    """Index tables describing the rows, columns, boxes and peers of an N x N board with p x q boxes.
+
+    All cells are referred to by their flat index row * N + col. These tables never change, so a
+    single Geometry is shared by every Grid with the same N, p, and q (see get_geometry).
+    """
+    def __init__(self, N, p, q):
+        self.N = N
+        self.p = p
+        self.q = q
+        self.cells = [(row, col) for row in xrange(N) for col in xrange(N)]  # flat index -> (row, col)
+
+        self.rows = [[row * N + col for col in xrange(N)] for row in xrange(N)]
+        self.cols = [[row * N + col for row in xrange(N)] for col in xrange(N)]
+        self.boxes = [[row * N + col
+                       for row in xrange(box_row, box_row + p)
+                       for col in xrange(box_col, box_col + q)]
+                      for box_row in xrange(0, N, p) for box_col in xrange(0, N, q)]
+        self.units = self.rows + self.cols + self.boxes
+
+        # cell_units[i] holds the unit numbers (index into self.units) of the row, column and box of cell i
+        self.cell_units = [(row, N + col, 2 * N + (row // p) * p + col // q) for (row, col) in self.cells]
+
+        # A row segment is the part of a row inside one box, and a column segment the part of a column
+        # inside one box. Groups are the units followed by all row segments and column segments, and
+        # cell_groups[i] holds the group numbers of cell i's row, column, box, row segment and column segment.
+        self.row_segments = [[row * N + col for col in xrange(box_col, box_col + q)]
+                             for row in xrange(N) for box_col in xrange(0, N, q)]
+        self.col_segments = [[row * N + col for row in xrange(box_row, box_row + p)]
+                             for col in xrange(N) for box_row in xrange(0, N, p)]
+        self.groups = self.units + self.row_segments + self.col_segments
+        self.cell_groups = [units + (3 * N + row * p + col // q, 3 * N + N * p + col * q + row // p)
+                            for units, (row, col) in zip(self.cell_units, self.cells)]
+        # Offsets of each cell's groups into tables holding N + 1 entries per group
+        self.cell_group_offsets = [tuple(g * (N + 1) for g in groups) for groups in self.cell_groups]
+
+        # For every row and column segment: the offsets of the segment, its line (row or column) and its box
+        # into tables holding N + 1 entries per group, followed by the cells of the line outside the segment
+        # and the cells of the box outside the segment. Used for pointing and box/line reduction.
+        self.segment_lines = []
+        for g in xrange(3 * N, len(self.groups)):
+            segment = self.groups[g]
+            row_unit, col_unit, box_unit = self.cell_units[segment[0]]
+            line_unit = row_unit if g < 3 * N + N * p else col_unit
+            self.segment_lines.append((g * (N + 1), line_unit * (N + 1), box_unit * (N + 1),
+                                       [i for i in self.units[line_unit] if i not in segment],
+                                       [i for i in self.units[box_unit] if i not in segment]))
+
+        # Peers are listed box first, then the rest of the row, then the rest of the column
+        self.peers = []
+        for i, (row, col) in enumerate(self.cells):
+            row_unit, col_unit, box_unit = self.cell_units[i]
+            box = [j for j in self.units[box_unit] if j != i]
+            row_rest = [j for j in self.units[row_unit] if j not in box and j != i]
+            col_rest = [j for j in self.units[col_unit] if j not in box and j != i]
+            self.peers.append(box + row_rest + col_rest)
+        self.peer_cells = [[self.cells[j] for j in peers] for peers in self.peers]
+
+
+_geometry_cache = {}
+
+
+def get_geometry(N, p, q):
+    """Returns the shared Geometry for boards of the given dimensions, building it on first use."""
+    key = (N, p, q)
+    geometry = _geometry_cache.get(key)
+    if geometry is None:
+        geometry = _geometry_cache[key] = Geometry(N, p, q)
+    return geometry
+
+
 class Grid(object):
     def __init__(self, N=9, p=3, q=3):
         self.N = N  # The number of tokens
         self.p = p  # The number of rows per block
         self.q = q  # The number of columns per block
-        self.grid = [[Cell(N) for col in xrange(N)] for row in xrange(N)]
+        self.geometry = get_geometry(N, p, q)
+        self.full_domain = (1 << (N + 1)) - 2  # bits 1 through N set
+        self.tokens = [0] * (N * N)
+        self.domains = [self.full_domain] * (N * N)
+        self.domain_sizes = [N] * (N * N)
+
+        # Value occupancy of each unit (see Geometry.units), kept up to date by assign and undo_assign.
+        # unit_counts[u * (N + 1) + v] is the number of cells in unit u holding token v, and bit v of
+        # unit_used[u] is set whenever that count is nonzero. conflicts counts every token which shares a
+        # unit with an equal token, so the board violates a constraint exactly when conflicts is nonzero.
+        self.unit_counts = [0] * (3 * N * (N + 1))
+        self.unit_used = [0] * (3 * N)
+        self.conflicts = 0
+        self.filled = 0  # number of cells holding a token
+
+        # Undo log of every change made to the board. Each change takes two slots: the cell index and the
+        # domain bitmask it had before the change, or for token changes the complemented cell index (~i)
+        # and the token it held before. The list is preallocated and grows by doubling; trail_size marks
+        # the end of the log. See checkpoint() and rollback().
+        self.trail = [0] * (4 * N * N)
+        self.trail_size = 0
+
+        # Trail positions at which the board was arc consistent, used by incremental arc consistency
+        self.consistent_marks = []
+
+        # Empty cells as a bitmask over cell indices, and bucketed by domain size: bit i of
+        # size_buckets[s] is set if cell i is empty and has s possible values. Used to find the
+        # first empty cell, or the first one with minimum remaining values, without scanning the board.
+        self.empty_mask = (1 << (N * N)) - 1
+        self.size_buckets = [0] * (N + 1)
+        self.size_buckets[N] = self.empty_mask
+
+        # degrees[i] is the number of peers of cell i which are empty and have at least 2 possible values
+        # (see degree_heuristic). Updated whenever a cell starts or stops meeting that condition.
+        self.degrees = [len(peers) if N > 1 else 0 for peers in self.geometry.peers]
+
+        # value_support[g * (N + 1) + v] is the number of empty cells in group g (see Geometry.groups) which
+        # still have v as a possible value. Used to count constrained peers for LCV (see peer_supports).
+        self.value_support = self._initial_value_support()
 
     def __str__(self):
         param_list = [' '.join((str(self.N), str(self.p), str(self.q)))]
@@ -15,6 +185,10 @@ class Grid(object):
     def __repr__(self):
         return str(self)
 
+    def inline(self):
+        """Returns the inline representation of the board: one character per cell in row major order."""
+        return ''.join(TOKENS[value - 1] if value else '.' for value in self.tokens)
+
     def display(self, highlights=None):
         """Returns a string of the board in an easy to read format.
 
@@ -32,7 +206,7 @@ class Grid(object):
             for col in xrange(self.N):
                 if col % self.q == 0 and col != 0:
                     col_list.append('|')  # column separator
-                cell_value = self.grid[row][col].token
+                cell_value = self.tokens[row * self.N + col]
                 if highlights is not None and (row, col) in highlights:
                     cell_value = '*'
                 cell_value = str(cell_value) if cell_value != 0 else '.'
@@ -44,8 +218,7 @@ class Grid(object):
 
     def display_cell(self, x, y):
         """Displays detailed information about the cell at (x, y). For testing and debugging use."""
-        cell = self.grid[x][y]
-        print 'Cell {}: token: {}, possible values: {}'.format((x, y), cell.token, self.possible_values(x, y))
+        print 'Cell {}: token: {}, possible values: {}'.format((x, y), self.cell_value(x, y), self.possible_values(x, y))
 
     def reset(self, x=None, y=None):
         """Resets the board, clearing all token values and eliminated candidates.
@@ -53,42 +226,189 @@ class Grid(object):
         Optional: If parameters x and y are supplied then only the cell at (x, y) will be reset.
         """
         if x is not None and y is not None:
-            cell = self.grid[x][y]
-            cell.token = 0
-            cell.possible_values.update(xrange(1, self.N + 1))
+            i = x * self.N + y
+            self.assign(x, y, 0)
+            self._set_domain(i, self.full_domain, self.N)
+            del self.consistent_marks[:]
             return
 
-        for row in xrange(self.N):
-            for col in xrange(self.N):
-                cell = self.grid[row][col]
-                cell.token = 0
-                cell.possible_values.update(xrange(1, self.N + 1))
+        size = self.N * self.N
+        self.tokens[:] = [0] * size
+        self.domains[:] = [self.full_domain] * size
+        self.domain_sizes[:] = [self.N] * size
+        self.unit_counts[:] = [0] * len(self.unit_counts)
+        self.unit_used[:] = [0] * len(self.unit_used)
+        self.conflicts = 0
+        self.filled = 0
+        self.trail_size = 0
+        del self.consistent_marks[:]
+        self.empty_mask = (1 << size) - 1
+        self.size_buckets[:] = [0] * (self.N + 1)
+        self.size_buckets[self.N] = self.empty_mask
+        self.degrees[:] = [len(peers) if self.N > 1 else 0 for peers in self.geometry.peers]
+        self.value_support[:] = self._initial_value_support()
+
+    def _initial_value_support(self):
+        """Returns the value support table of an empty board."""
+        support = []
+        for group in self.geometry.groups:
+            support.extend([0] + [len(group)] * self.N)
+        return support
+
+    def checkpoint(self):
+        """Returns a marker for the current state of the board, which rollback() can later restore."""
+        return self.trail_size
+
+    def rollback(self, mark):
+        """Undoes every assignment and elimination made since checkpoint() returned mark."""
+        trail = self.trail
+        n = self.trail_size
+        while n > mark:
+            n -= 2
+            i = trail[n]
+            if i >= 0:
+                self._update_domain(i, trail[n + 1], popcount(trail[n + 1]))
+            else:
+                self._set_token(~i, trail[n + 1])
+        self.trail_size = n
+
+        consistent_marks = self.consistent_marks
+        while consistent_marks and consistent_marks[-1] > n:
+            consistent_marks.pop()
+
+    def _record(self, entry, old):
+        """Appends a change to the trail, doubling its capacity when it is full."""
+        n = self.trail_size
+        if n + 2 > len(self.trail):
+            self.trail.extend([0] * (len(self.trail) + 2))
+        self.trail[n] = entry
+        self.trail[n + 1] = old
+        self.trail_size = n + 2
+
+    def _set_domain(self, i, mask, size):
+        """Replaces the domain of cell i with mask (which has size bits set), recording the old domain."""
+        self._record(i, self.domains[i])
+        self._update_domain(i, mask, size)
+
+    def _update_domain(self, i, mask, size):
+        """Replaces the domain of cell i with mask, keeping the domain size buckets up to date. Not recorded
+        on the trail."""
+        if not self.tokens[i]:
+            old_mask = self.domains[i]
+            if old_mask & ~mask:
+                self._update_value_support(i, old_mask & ~mask, -1)
+            if mask & ~old_mask:
+                self._update_value_support(i, mask & ~old_mask, 1)
+            old_size = self.domain_sizes[i]
+            if old_size != size:
+                bit = 1 << i
+                self.size_buckets[old_size] ^= bit
+                self.size_buckets[size] |= bit
+                if (old_size > 1) != (size > 1):
+                    self._update_degrees(i, 1 if size > 1 else -1)
+        self.domains[i] = mask
+        self.domain_sizes[i] = size
+
+    def _update_value_support(self, i, mask, delta):
+        """Adds delta to the support of every value in mask, in every group containing cell i."""
+        support = self.value_support
+        offsets = self.geometry.cell_group_offsets[i]
+        for value in mask_values(mask):
+            for offset in offsets:
+                support[offset + value] += delta
+
+    def _update_degrees(self, i, delta):
+        """Adds delta to the degree of every peer of cell i."""
+        degrees = self.degrees
+        for j in self.geometry.peers[i]:
+            degrees[j] += delta
 
     def assign(self, x, y, value):
         """Assigns value to the cell at (x, y)"""
-        self.grid[x][y].token = value
+        i = x * self.N + y
+        if self.tokens[i] != value:
+            if self.tokens[i]:
+                del self.consistent_marks[:]  # removing a token can make pruned values legal again
+            self._record(~i, self.tokens[i])
+            self._set_token(i, value)
+
+    def _set_token(self, i, value):
+        """Places value in cell i, keeping the unit occupancy counts and empty cell sets up to date. Not
+        recorded on the trail."""
+        old_value = self.tokens[i]
+        if old_value == value:
+            return
+        stride = self.N + 1
+        counts = self.unit_counts
+        units = self.geometry.cell_units[i]
+        if not old_value or not value:
+            bit = 1 << i
+            self.empty_mask ^= bit
+            self.size_buckets[self.domain_sizes[i]] ^= bit
+            if self.domain_sizes[i] > 1:
+                self._update_degrees(i, -1 if value else 1)
+            self._update_value_support(i, self.domains[i], -1 if value else 1)
+        if old_value:
+            self.filled -= 1
+            for u in units:
+                k = u * stride + old_value
+                counts[k] -= 1
+                if counts[k]:
+                    self.conflicts -= 1
+                else:
+                    self.unit_used[u] ^= 1 << old_value
+        if value:
+            self.filled += 1
+            for u in units:
+                k = u * stride + value
+                if counts[k]:
+                    self.conflicts += 1
+                else:
+                    self.unit_used[u] |= 1 << value
+                counts[k] += 1
+        self.tokens[i] = value
 
     def undo_assign(self, x, y):
-        self.grid[x][y].token = 0
+        self.assign(x, y, 0)
 
     def eliminate(self, x, y, possible_value):
         """Eliminates possible_value from the cell at (x, y)"""
-        self.grid[x][y].possible_values.discard(possible_value)
+        i = x * self.N + y
+        bit = 1 << possible_value
+        if self.domains[i] & bit:
+            self._set_domain(i, self.domains[i] ^ bit, self.domain_sizes[i] - 1)
 
     def undo_eliminate(self, x, y, possible_value):
-        self.grid[x][y].possible_values.add(possible_value)
+        i = x * self.N + y
+        bit = 1 << possible_value
+        if not self.domains[i] & bit:
+            del self.consistent_marks[:]  # a restored value can make pruned values legal again
+            self._set_domain(i, self.domains[i] | bit, self.domain_sizes[i] + 1)
 
     def cell_filled(self, x, y):
-        return self.grid[x][y].token != 0
+        return self.tokens[x * self.N + y] != 0
 
     def cell_empty(self, x, y):
-        return self.grid[x][y].token == 0
+        return self.tokens[x * self.N + y] == 0
 
     def cell_value(self, x, y):
-        return self.grid[x][y].token
+        return self.tokens[x * self.N + y]
 
     def possible_values(self, x, y):
-        return self.grid[x][y].possible_values
+        """Returns a sorted list of the possible values of the cell at (x, y)."""
+        return mask_values(self.domains[x * self.N + y])
+
+    def is_possible_value(self, x, y, value):
+        """Returns True if value is still in the domain of the cell at (x, y)."""
+        return bool(self.domains[x * self.N + y] & (1 << value))
+
+    def domain(self, x, y):
+        """Returns the domain of the cell at (x, y) as a bitmask."""
+        return self.domains[x * self.N + y]
+
+    def domain_size(self, x, y):
+        """Returns the number of possible values of the cell at (x, y)."""
+        return self.domain_sizes[x * self.N + y]
 
     def degree_heuristic(self, x, y):
         """Returns the degree of the given cell to other unassigned cells.
@@ -96,75 +416,49 @@ class Grid(object):
         To calculate the degree of a cell we need to count how many of its peers are both empty
         and have at least 2 possible values. Cells which are empty but have only 1 possible value
         are considered solved and are ignored by the degree heuristic, even if they haven't been
-        explicitly assigned by backtrack."""
-        # upperleft_x and upperleft_y designate the upper left corner of the peer box
-        upperleft_x = x - x % self.p
-        upperleft_y = y - y % self.q
-
-        box_xs = xrange(upperleft_x, upperleft_x + self.p)
-        box_ys = xrange(upperleft_y, upperleft_y + self.q)
-
-        box = [(bxs, bys) for bxs in box_xs for bys in box_ys if self.cell_empty(bxs, bys) and
-               len(self.possible_values(bxs, bys)) > 1 and (bxs, bys) != (x, y)]
-        row = [(x, rys) for rys in xrange(0, upperleft_y) if self.cell_empty(x, rys) and
-               len(self.possible_values(x, rys)) > 1] + \
-              [(x, rys) for rys in xrange(upperleft_y + self.q, self.N) if self.cell_empty(x, rys) and
-               len(self.possible_values(x, rys)) > 1]
-        col = [(cxs, y) for cxs in xrange(0, upperleft_x) if self.cell_empty(cxs, y) and
-               len(self.possible_values(cxs, y)) > 1] + \
-              [(cxs, y) for cxs in xrange(upperleft_x + self.p, self.N) if self.cell_empty(cxs, y) and
-               len(self.possible_values(cxs, y)) > 1]
-
-        return len(box + row + col)
-
-    # Alternate implementation. This one doesn't use list comprehensions so it might be faster (less memory allocation?)
-    def degree_heuristic2(self, x, y):
-        upper_left_x = x - x % self.p
-        upper_left_y = y - y % self.q
-
-        degree = 0
-
-        # Count in the box
-        for bxs in xrange(upper_left_x, upper_left_x + self.p):
-            for bys in xrange(upper_left_y, upper_left_y + self.q):
-                if self.cell_empty(bxs, bys) and len(self.possible_values(bxs, bys)) > 1 and (bxs, bys) != (x, y):
-                    degree += 1
-
-        # Count in the row
-        for rys in xrange(0, upper_left_y):
-            if self.cell_empty(x, rys) and len(self.possible_values(x, rys)) > 1:
-                degree += 1
-        for rys in xrange(upper_left_y + self.q, self.N):
-            if self.cell_empty(x, rys) and len(self.possible_values(x, rys)) > 1:
-                degree += 1
-
-        # Count in the column
-        for cxs in xrange(0, upper_left_x):
-            if self.cell_empty(cxs, y) and len(self.possible_values(cxs, y)) > 1:
-                degree += 1
-        for cxs in xrange(upper_left_x + self.p, self.N):
-            if self.cell_empty(cxs, y) and len(self.possible_values(cxs, y)) > 1:
-                degree += 1
-
-        return degree
+        explicitly assigned by backtrack.
+
+        The count is maintained as cells are assigned and their domains change, so this is a lookup."""
+        return self.degrees[x * self.N + y]
 
+    def peer_supports(self, x, y):
+        """Returns a list whose vth element is the number of empty peers of the cell at (x, y) which
+        still have v as a possible value, for every value v in that cell's domain (0 elsewhere).
+
+        Each count is read from the value support table: a peer lies in the cell's row, column or
+        box, and peers in both the row and box (or column and box) lie in the cell's row (or column)
+        segment, so they are subtracted once. The cell itself lies in all five groups, and is
+        subtracted once more if it is empty.
+        """
+        i = x * self.N + y
+        support = self.value_support
+        row, col, box, row_segment, col_segment = self.geometry.cell_group_offsets[i]
+        own = 0 if self.tokens[i] else 1
+        supports = [0] * (self.N + 1)
+        for value in mask_values(self.domains[i]):
+            supports[value] = (support[row + value] + support[col + value] + support[box + value] -
+                               support[row_segment + value] - support[col_segment + value] - own)
+        return supports
 
     def forward_check(self, x, y, value):
         """Removes value as a possible value from all the peers of cell (x, y).
 
         Only modifies peers which contain value as a possible value.
-        Returns True/False if the board is still viable, and a list of all changes made.
+        Returns True/False if the board is still viable, and a checkpoint which undo_changes() can use to
+        undo the changes made.
         """
-        changed_list = []
-        for (row, col) in self.peers(x, y):
-            if value in self.possible_values(row, col):
-                changed_list.append(((row, col), [value]))
-                self.eliminate(row, col, value)
-                if not self.possible_values(row, col):
-                    return False, changed_list
-        return True, changed_list
-
-    def arc_consistency(self):
+        mark = self.checkpoint()
+        bit = 1 << value
+        domains = self.domains
+        domain_sizes = self.domain_sizes
+        for i in self.geometry.peers[x * self.N + y]:
+            if domains[i] & bit:
+                self._set_domain(i, domains[i] ^ bit, domain_sizes[i] - 1)
+                if not domain_sizes[i]:
+                    return False, mark
+        return True, mark
+
+    def arc_consistency(self, incremental=False):
         """Establishes arc consistency on board.
 
         A cell i is arc consistent with another cell j if, for each possible value in i's domain,
@@ -172,104 +466,238 @@ class Grid(object):
         each other, as non-peer cells can never violate a constraint by their very nature. A board
         is arc consistent if all of its cells are arc consistent with each of their peers.
 
-        Returns True if the board is solvable, False otherwise. Also returns a list of all changes
-        which have been made to board, so that they can be undone if needed.
+        Since every constraint is an inequality, an arc (i, j) can only remove values from i when
+        cell j holds a token or has a single possible value left, and then it removes exactly that
+        value. So instead of a stack of arcs we keep a queue of such cells j, each queued at most once
+        at a time, and revise all arcs pointing at j when it is taken off the queue.
+
+        :param incremental: Optional, if True and the board was made arc consistent earlier (and not
+        rolled back past that point since), only the cells changed since then are queued initially.
+        Otherwise every cell is queued.
+
+        Returns True if the board is solvable, False otherwise. Also returns a checkpoint which
+        undo_changes() can use to undo the changes made to board, if needed.
+        """
+        mark = self.checkpoint()  # all changes made to board can be undone by rolling back to here
+        tokens = self.tokens
+        domains = self.domains
+        domain_sizes = self.domain_sizes
+        peers = self.geometry.peers
+
+        if incremental and self.consistent_marks:
+            queued = [False] * (self.N * self.N)
+            queue = []
+            trail = self.trail
+            for n in xrange(self.consistent_marks[-1], self.trail_size, 2):
+                j = trail[n] if trail[n] >= 0 else ~trail[n]
+                if not queued[j]:
+                    queued[j] = True
+                    queue.append(j)
+        else:
+            queued = [True] * (self.N * self.N)
+            queue = range(self.N * self.N - 1, -1, -1)
+
+        while queue:
+            j = queue.pop()
+            queued[j] = False
+            # A value in cell i's domain has no legal partner in cell j if it is cell j's token, or if it
+            # is the only value left in cell j's domain. An empty token sets bit 0, which no domain uses.
+            conflicts = 1 << tokens[j]
+            if domain_sizes[j] == 1:
+                conflicts |= domains[j]
+            if conflicts == 1:
+                continue
+            for i in peers[j]:
+                del_mask = domains[i] & conflicts
+                if del_mask:
+                    new_domain = domains[i] ^ del_mask
+                    size = popcount(new_domain)
+                    self._set_domain(i, new_domain, size)
+                    if size == 0:
+                        return False, mark
+                    if size == 1 and not queued[i]:
+                        queued[i] = True
+                        queue.append(i)
+
+        if not self.consistent_marks or self.consistent_marks[-1] != self.trail_size:
+            self.consistent_marks.append(self.trail_size)
+        return True, mark
+
+    def propagate(self, incremental=False, max_subset=3):
+        """Applies constraint propagation to the board until none of its rules removes a value.
+
+        Arc consistency (see arc_consistency) handles naked singles. On top of that:
+        - Hidden singles: a value which only one cell in a unit can still hold is that cell's only value.
+        - Naked subsets: if k cells in a unit have only k possible values between them (for k from 2 up
+          to max_subset), those values are removed from the other cells in the unit.
+        - Pointing and box/line reduction: if a value's possible places in a box all lie in one row (or
+          column), it is removed from the rest of that row (or column), and vice versa.
+        Each rule is only applied once the cheaper rules before it no longer change the board.
+
+        :param incremental: Optional, passed on to the first call of arc_consistency.
+
+        Returns True if the board is still viable, False if some cell or unit ran out of possible values.
+        Also returns a checkpoint which undo_changes() can use to undo the changes made to board.
         """
-        def revise(board, cell_i, cell_j):
-            """Make cell_i arc consistent with cell_j. If a possible value in cell_i's
-            domain leaves cell_j with no legal assignment, then discard that value from
-            cell_i's domain. Returns True if cell_i's domain has been modified, False
-            otherwise. Also returns a record of all changes made to the cell.
-            """
-            revised = False
-            del_list = []
-            for i_value in board.possible_values(*cell_i):
-                domain_j = board.possible_values(*cell_j)
-                if board.cell_value(*cell_j) == i_value or (len(domain_j) == 1 and i_value in domain_j):
-                    del_list.append(i_value)
-                    revised = True
-            # We have to do all the eliminations here since we cannot edit the possible_values set
-            # while iterating over it. This is a property of the set built-in type in Python.
-            for i_value in del_list:
-                board.eliminate(cell_i[0], cell_i[1], i_value)
-
-            changed_record = (cell_i, del_list)
-            return revised, changed_record
-
-        # Begin Arc Consistency here by creating a stack of all arcs in the board
-        cells = [(row, col) for row in xrange(self.N) for col in xrange(self.N)]
-        arcs = [(cell_i, cell_j) for cell_i in cells for cell_j in self.peers(*cell_i)]
-
-        changed_list = []  # track all changes made to board so they can be undone if needed
-        while arcs:
-            cell_i, cell_j = arcs.pop()
-            revised, r_changed_record = revise(self, cell_i, cell_j)
-            if revised:
-                changed_list.append(r_changed_record)
-                if len(self.possible_values(*cell_i)) == 0:
-                    return False, changed_list
-                for peer in self.peers(*cell_i):
-                    if peer != cell_j:
-                        arcs.append((peer, cell_i))
-        return True, changed_list
-
-    def undo_changes(self, changed_list):
-        """Undo changes made by forward check or arc consistency."""
-        for change in changed_list:
-            (row, col), values = change
+        mark = self.checkpoint()
+        viable = self.arc_consistency(incremental)[0]
+        while viable:
+            size = self.trail_size
+            viable = self._hidden_singles()
+            if viable and self.trail_size == size:
+                viable = self._naked_subsets(max_subset)
+                if viable and self.trail_size == size:
+                    viable = self._locked_candidates()
+                    if viable and self.trail_size == size:
+                        break
+            if viable:
+                viable = self.arc_consistency(incremental=True)[0]
+        return viable, mark
+
+    def _remove_values(self, i, mask):
+        """Removes the values in mask from the domain of cell i if it is empty. Returns False if that leaves
+        the cell without any possible values."""
+        old_mask = self.domains[i]
+        if self.tokens[i] or not old_mask & mask:
+            return True
+        new_mask = old_mask & ~mask
+        size = popcount(new_mask)
+        self._set_domain(i, new_mask, size)
+        return size > 0
+
+    def _hidden_singles(self):
+        """Reduces the domain of each cell which is the only place left in one of its units for some value.
+        Returns False if some unit has no place left for a value it does not hold yet."""
+        N = self.N
+        support = self.value_support
+        domains = self.domains
+        tokens = self.tokens
+        for u, unit in enumerate(self.geometry.units):
+            missing = self.full_domain & ~self.unit_used[u]
+            offset = u * (N + 1)
+            for value in mask_values(missing):
+                places = support[offset + value]
+                if places == 0:
+                    return False
+                if places == 1:
+                    bit = 1 << value
+                    for i in unit:
+                        if not tokens[i] and domains[i] & bit:
+                            if domains[i] != bit:
+                                self._set_domain(i, bit, 1)
+                            break
+        return True
+
+    def _naked_subsets(self, max_subset):
+        """Removes the values of each naked pair, triple, etc. (up to max_subset cells) from the rest of
+        their unit. Returns False if that leaves some cell without any possible values."""
+        domains = self.domains
+        domain_sizes = self.domain_sizes
+        tokens = self.tokens
+        for unit in self.geometry.units:
+            for k in xrange(2, max_subset + 1):
+                candidates = [i for i in unit if not tokens[i] and 1 < domain_sizes[i] <= k]
+                if len(candidates) < k:
+                    continue
+                for subset in itertools.combinations(candidates, k):
+                    values = 0
+                    for i in subset:
+                        values |= domains[i]
+                    if popcount(values) != k:
+                        continue
+                    for i in unit:
+                        if i not in subset and not self._remove_values(i, values):
+                            return False
+        return True
+
+    def _locked_candidates(self):
+        """Applies pointing (a value confined to one line within a box is removed from the rest of the
+        line) and box/line reduction (a value confined to one box within a line is removed from the rest
+        of the box). Returns False if that leaves some cell without any possible values."""
+        support = self.value_support
+        values = range(1, self.N + 1)
+        for segment, line, box, line_rest, box_rest in self.geometry.segment_lines:
             for value in values:
-                self.undo_eliminate(row, col, value)
+                places = support[segment + value]
+                if not places:
+                    continue
+                if support[box + value] == places and support[line + value] > places:
+                    rest = line_rest
+                elif support[line + value] == places and support[box + value] > places:
+                    rest = box_rest
+                else:
+                    continue
+                bit = 1 << value
+                for i in rest:
+                    if not self._remove_values(i, bit):
+                        return False
+        return True
+
+    def undo_changes(self, mark):
+        """Undo changes made by forward check, arc consistency or propagate, given the checkpoint it returned.
+
+        Any changes made to the board after that are undone as well.
+        """
+        self.rollback(mark)
 
     def empty_cells(self):
         """Returns a list of all the empty cells in the board, in the form (x, y)."""
-        return [(row, col) for row in xrange(self.N) for col in xrange(self.N) if self.cell_empty(row, col)]
+        cells = self.geometry.cells
+        return [cells[i] for i in bit_indices(self.empty_mask)]
+
+    def first_empty_cell(self):
+        """Returns the first empty cell in row major order as a tuple (x, y), or None if the board is full."""
+        if not self.empty_mask:
+            return None
+        return self.geometry.cells[(self.empty_mask & -self.empty_mask).bit_length() - 1]
+
+    def mrv_cell(self):
+        """Returns the first empty cell with the fewest possible values as a tuple (x, y), or None if the
+        board is full."""
+        for bucket in self.size_buckets:
+            if bucket:
+                return self.geometry.cells[(bucket & -bucket).bit_length() - 1]
+        return None
+
+    def mrv_cells(self):
+        """Returns a list of all the empty cells tied for the fewest possible values, in the form (x, y)."""
+        cells = self.geometry.cells
+        for bucket in self.size_buckets:
+            if bucket:
+                return [cells[i] for i in bit_indices(bucket)]
+        return []
 
     def peers(self, x, y):
-        """Returns a list of all the peer cells of the given cell, in the form (x, y)."""
-
-        # upperleft_x and upperleft_y designate the upper left corner of the peer box
-        upperleft_x = x - x % self.p
-        upperleft_y = y - y % self.q
+        """Returns a list of all the peer cells of the given cell, in the form (x, y).
 
-        box_xs = xrange(upperleft_x, upperleft_x + self.p)
-        box_ys = xrange(upperleft_y, upperleft_y + self.q)
-
-        box = [(bxs, bys) for bxs in box_xs for bys in box_ys if (bxs, bys) != (x, y)]
-        row = [(x, rys) for rys in xrange(0, upperleft_y)] + [(x, rys) for rys in xrange(upperleft_y + self.q, self.N)]
-        col = [(cxs, y) for cxs in xrange(0, upperleft_x)] + [(cxs, y) for cxs in xrange(upperleft_x + self.p, self.N)]
-
-        return box + row + col
+        The list is shared by all boards with the same dimensions and must not be modified.
+        """
+        return self.geometry.peer_cells[x * self.N + y]
 
     def violates_constraints(self, x, y, value):
         """Checks if assigning value to the cell at (x, y) violates a row/column/box constraint."""
         if value == 0:  # zero designates an empty cell and thus never causes a violation
             return False
 
-        for (row, col) in self.peers(x, y):
-            if self.grid[row][col].token == value:
+        i = x * self.N + y
+        own = 1 if self.tokens[i] == value else 0  # the cell itself is counted in all three of its units
+        stride = self.N + 1
+        counts = self.unit_counts
+        for u in self.geometry.cell_units[i]:
+            if counts[u * stride + value] > own:
                 return True
 
         return False
 
+    def used_values(self, x, y):
+        """Returns a bitmask of the tokens held by the cells in the row, column, and box of (x, y)."""
+        row_unit, col_unit, box_unit = self.geometry.cell_units[x * self.N + y]
+        return self.unit_used[row_unit] | self.unit_used[col_unit] | self.unit_used[box_unit]
+
     def verify(self):
         """Returns True if the board has no constraint violations, False otherwise."""
-        for row in xrange(self.N):
-            for col in xrange(self.N):
-                if self.violates_constraints(row, col, self.grid[row][col].token):
-                    return False
-        return True
+        return self.conflicts == 0
 
     def solved(self):
         """Returns True if the board has a complete and consistent assignment, False otherwise."""
-        for row in xrange(self.N):
-            for col in xrange(self.N):
-                cell_value = self.cell_value(row, col)
-                if cell_value == 0 or self.violates_constraints(row, col, cell_value):
-                    return False
-        return True
-
-
-class Cell(object):
-    def __init__(self, N):
-        self.token = 0
-        self.possible_values = set(xrange(1, N + 1))
+        return self.filled == self.N * self.N and self.conflicts == 0
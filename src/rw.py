@@ -1,8 +1,12 @@
 __author__ = 'jshoham'
 
 # A simple module for reading and writing to files
+import sys
 import os
 import traceback
+import mmap
+import struct
+import grid
 
 OVERWRITE = 1
 
@@ -17,9 +21,261 @@ def read_file(file_path):
         exit(-1)
 
 
-def write_file(file_path, f_str, overwrite_flag=0):
-    """Writes f_str out to filename. If filename already exists then write to a new file
-    with (x) appended to it. So if 'example.txt' exists then write to 'example (1).txt' instead"""
+def iter_puzzles(file_path):
+    """Reads the file line by line, yielding the line number where each puzzle starts and the string of
+    the puzzle as soon as it has been read.
+
+    Both puzzle representations are recognized, and may even be mixed in one file: a line holding
+    three integers 'N p q' starts a puzzle in the default representation which includes the next N
+    lines, and any other line is a puzzle in the inline representation. Blank lines are skipped.
+    The puzzles are not validated, so a truncated puzzle at the end of the file is yielded as is.
+    """
+    try:
+        f = open(file_path)
+    except:
+        print "Error: Failed to open file", file_path
+        traceback.print_exc()
+        exit(-1)
+
+    with f:
+        lines = enumerate(f, 1)
+        for line_number, line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            params = line.split()
+            if len(params) == 3 and all(param.isdigit() for param in params):
+                puzzle_lines = [line]
+                for row in xrange(int(params[0])):
+                    row_line = next(lines, None)
+                    if row_line is None:
+                        break
+                    puzzle_lines.append(row_line[1].strip())
+                yield line_number, '\n'.join(puzzle_lines)
+            else:
+                yield line_number, line
+
+
+def puzzle_cells(board_str, first_line=1):
+    """Parses a puzzle string in either representation, returning (N, p, q, cells) where cells lists the
+    value of every cell in row major order (0 for blank cells).
+
+    If board_str is not a valid puzzle a ValueError is raised, whose message gives the line of the problem,
+    counting the first line of board_str as first_line.
+    """
+    if ' ' not in board_str and '\n' not in board_str:  # inline representation (N*N chars on a line)
+        dimensions = grid.inline_dimensions(len(board_str))
+        if dimensions is None:
+            raise ValueError('Line {}: no puzzle has an inline representation of length {}'.format(
+                first_line, len(board_str)))
+        N, p, q = dimensions
+        token_values = grid.TOKEN_VALUES
+        cells = [token_values.get(char, N + 1) for char in board_str]
+        for i, cell_value in enumerate(cells):
+            if cell_value > N:
+                raise ValueError('Line {}: invalid token {!r} at column {}'.format(
+                    first_line, board_str[i], i + 1))
+        return N, p, q, cells
+
+    else:  # default representation (first line 'N p q' followed by N lines)
+        row_list = board_str.splitlines()
+        params = row_list[0].split()
+        if len(params) != 3 or not all(param.isdigit() for param in params):
+            raise ValueError('Line {}: expected the puzzle parameters N p q'.format(first_line))
+        N, p, q = [int(x) for x in params]
+        if N < 1 or N != p * q:
+            raise ValueError('Line {}: invalid puzzle parameters, N must equal p*q'.format(first_line))
+        if len(row_list) < N + 1:
+            raise ValueError('Line {}: puzzle ends after {} of {} rows'.format(
+                first_line + len(row_list) - 1, len(row_list) - 1, N))
+        cells = []
+        for row in xrange(N):
+            col_list = row_list[row + 1].split()
+            if len(col_list) != N:
+                raise ValueError('Line {}: expected {} values, found {}'.format(
+                    first_line + row + 1, N, len(col_list)))
+            for col, cell in enumerate(col_list):
+                cell_value = int(cell) if cell.isdigit() else N + 1
+                if cell_value > N:
+                    raise ValueError('Line {}: invalid value {!r} in column {}'.format(
+                        first_line + row + 1, cell, col + 1))
+                cells.append(cell_value)
+        return N, p, q, cells
+
+
+def puzzle_str(N, p, q, cells):
+    """Returns the string of a puzzle given as by puzzle_cells: the inline representation if the puzzle
+    has one, otherwise the default representation."""
+    if grid.inline_dimensions(N * N) == (N, p, q):
+        return ''.join(grid.TOKENS[value - 1] if value else '.' for value in cells)
+    param_line = '{} {} {}'.format(N, p, q)
+    row_lines = [' '.join(str(value) for value in cells[row * N:(row + 1) * N]) for row in xrange(N)]
+    return '\n'.join([param_line] + row_lines)
+
+
+# Packed puzzle files:
+# A binary container of puzzles which can be read with random access, so puzzles don't need to be parsed
+# from text. The file starts with a header holding the magic string 'SDKP', the format version, the number
+# of puzzles and the offset of the index. Each puzzle record holds N, p, and q as 16 bit integers followed
+# by its cells in row major order, packed into N.bit_length() bits each (so 4 bits per cell for a 9x9
+# puzzle) starting from the low bits of each byte. The index lists the offset of every record as a 64 bit
+# integer, and follows the last record. All integers are little endian.
+PACKED_MAGIC = 'SDKP'
+PACKED_VERSION = 1
+_packed_header = struct.Struct('<4sHIQ')  # magic, version, puzzle count, index offset
+_packed_params = struct.Struct('<HHH')  # N, p, q
+_packed_offset = struct.Struct('<Q')
+
+
+def _pack_cells(cells, bits):
+    packed = bytearray()
+    acc = 0
+    acc_bits = 0
+    for cell_value in cells:
+        acc |= cell_value << acc_bits
+        acc_bits += bits
+        while acc_bits >= 8:
+            packed.append(acc & 0xFF)
+            acc >>= 8
+            acc_bits -= 8
+    if acc_bits:
+        packed.append(acc)
+    return packed
+
+
+def _unpack_cells(packed, bits, count):
+    cells = []
+    mask = (1 << bits) - 1
+    acc = 0
+    acc_bits = 0
+    for byte in bytearray(packed):
+        acc |= byte << acc_bits
+        acc_bits += 8
+        while acc_bits >= bits and len(cells) < count:
+            cells.append(acc & mask)
+            acc >>= bits
+            acc_bits -= bits
+    return cells
+
+
+def is_packed_file(file_path):
+    """Returns True if the file is a packed puzzle file."""
+    try:
+        with open(file_path, 'rb') as f:
+            return f.read(len(PACKED_MAGIC)) == PACKED_MAGIC
+    except IOError:
+        return False
+
+
+def write_packed(file_path, puzzles, overwrite_flag=0):
+    """Writes the puzzles, each given as (N, p, q, cells) like puzzle_cells returns, to a packed puzzle file.
+    The puzzles can be any iterable and are written as they are read. Returns the number of puzzles."""
+    try:
+        f = open(available_path(file_path, overwrite_flag), 'w+b')
+    except:
+        print 'Error: Failed to open output file', file_path
+        traceback.print_exc()
+        exit(-1)
+
+    with f:
+        f.write(_packed_header.pack(PACKED_MAGIC, PACKED_VERSION, 0, 0))
+        offsets = []
+        for N, p, q, cells in puzzles:
+            offsets.append(f.tell())
+            f.write(_packed_params.pack(N, p, q))
+            f.write(_pack_cells(cells, N.bit_length()))
+        index_offset = f.tell()
+        f.write(''.join(_packed_offset.pack(offset) for offset in offsets))
+        f.seek(0)
+        f.write(_packed_header.pack(PACKED_MAGIC, PACKED_VERSION, len(offsets), index_offset))
+    return len(offsets)
+
+
+class PackedPuzzles(object):
+    """Read only access to the puzzles of a packed puzzle file, which is memory mapped rather than read.
+
+    The puzzles are indexed from 0. Indexing returns the puzzle string (see puzzle_str) and cells returns
+    the parsed puzzle, decoding only the requested record.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        with open(file_path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, self.index_offset = _packed_header.unpack_from(self.mm, 0)
+        if magic != PACKED_MAGIC or version != PACKED_VERSION:
+            self.mm.close()
+            raise ValueError('{} is not a packed puzzle file of version {}'.format(file_path, PACKED_VERSION))
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return puzzle_str(*self.cells(index))
+
+    def __iter__(self):
+        for index in xrange(self.count):
+            yield self[index]
+
+    def cells(self, index):
+        """Returns (N, p, q, cells) of the puzzle at index."""
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('puzzle index out of range')
+        offset = _packed_offset.unpack_from(self.mm, self.index_offset + index * _packed_offset.size)[0]
+        N, p, q = _packed_params.unpack_from(self.mm, offset)
+        bits = N.bit_length()
+        start = offset + _packed_params.size
+        cells = _unpack_cells(self.mm[start:start + (N * N * bits + 7) // 8], bits, N * N)
+        return N, p, q, cells
+
+    def close(self):
+        self.mm.close()
+
+
+_packed_files = {}
+
+
+def open_packed(file_path):
+    """Returns a PackedPuzzles for the file, reusing the one already opened by this process if any."""
+    packed = _packed_files.get(file_path)
+    if packed is None:
+        packed = _packed_files[file_path] = PackedPuzzles(file_path)
+    return packed
+
+
+def text_to_packed(text_path, packed_path, overwrite_flag=0):
+    """Converts a text file of puzzles in either representation to a packed puzzle file. Invalid puzzles
+    are reported and skipped. Returns the number of puzzles written."""
+    def puzzles():
+        for pnum, (line_number, board_str) in enumerate(iter_puzzles(text_path), 1):
+            try:
+                yield puzzle_cells(board_str, line_number)
+            except ValueError as e:
+                print 'Skipping puzzle {}. {}'.format(pnum, e)
+
+    return write_packed(packed_path, puzzles(), overwrite_flag)
+
+
+def packed_to_text(packed_path, text_path, overwrite_flag=0):
+    """Converts a packed puzzle file to a text file, writing each puzzle in the inline representation if it
+    has one and in the default representation otherwise. Returns the number of puzzles written."""
+    packed = PackedPuzzles(packed_path)
+    try:
+        with open_output_file(text_path, overwrite_flag) as f:
+            for index, board_str in enumerate(packed):
+                if index:
+                    f.write('\n')
+                f.write(board_str)
+        return len(packed)
+    finally:
+        packed.close()
+
+
+def available_path(file_path, overwrite_flag=0):
+    """Returns file_path, or if that file already exists (and overwrite_flag is not set), the first path
+    with (x) appended to it which does not exist. So if 'example.txt' exists then 'example (1).txt'"""
     root, ext = os.path.splitext(file_path)
     new_file_path = file_path
     if not overwrite_flag:
@@ -29,8 +285,25 @@ def write_file(file_path, f_str, overwrite_flag=0):
             i += 1
             new_root = '{} ({})'.format(root, i)
             new_file_path = new_root + ext
+    return new_file_path
+
+
+def open_output_file(file_path, overwrite_flag=0):
+    """Opens a file for writing, using the same naming rule as write_file. Use this to write output
+    incrementally, instead of building the whole output string first."""
+    try:
+        return open(available_path(file_path, overwrite_flag), 'w+')
+    except:
+        print 'Error: Failed to open output file', file_path
+        traceback.print_exc()
+        exit(-1)
+
+
+def write_file(file_path, f_str, overwrite_flag=0):
+    """Writes f_str out to filename. If filename already exists then write to a new file
+    with (x) appended to it. So if 'example.txt' exists then write to 'example (1).txt' instead"""
     try:
-        with open(new_file_path, 'w+') as f:
+        with open(available_path(file_path, overwrite_flag), 'w+') as f:
             f.write(f_str)
     except:
         print 'Error: Failed to open output file', file_path
@@ -49,4 +322,21 @@ def adjust_col_widths(table):
     col_widths = [max([len(item) for item in col]) for col in zipped_table]
     width_adjusted_columns = [[item.ljust(width) for item in column] for (width, column) in
                            zip(col_widths, zipped_table)]
-    return zip(*width_adjusted_columns)
\ No newline at end of file
+    return zip(*width_adjusted_columns)
+
+
+def main(*args):
+    if len(args) != 2:
+        print "rw.py requires exactly 2 arguments ({} given).".format(len(args))
+        exit(-1)
+
+    input_filepath, output_filepath = args
+    if is_packed_file(input_filepath):
+        count = packed_to_text(input_filepath, output_filepath)
+    else:
+        count = text_to_packed(input_filepath, output_filepath)
+    print 'Converted {} puzzles.'.format(count)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -2,6 +2,12 @@
 ##### User Changeable Settings #####
 ####################################
 
+##### Search Engine Settings #####
+# engine - 'csp' searches with backtracking, using the settings below
+#       'dlx' searches for an exact cover with Dancing Links (Extra feature). Only the pre-processing settings
+#       (acp, fcp, cpp) and time_limit apply to it.
+engine = 'csp'
+
 ##### Backtracking Settings #####
 # fc - Forward Checking
 # mrv - Minimum Remaining Values
@@ -10,6 +16,9 @@
 # acp - Arc Consistency Pre-processing
 # ac - Arc Consistency
 # fcp - Forward Checking Pre-processing (Extra feature: Not mentioned in project description)
+# cpp - Constraint Propagation Pre-processing: arc consistency plus hidden singles, naked pairs/triples,
+#       and pointing/box-line reduction (Extra feature)
+# cp - Constraint Propagation after every assignment, using the same rules as cpp (Extra feature)
 # time_limit - Timeout limit in seconds for backtracking search (Zero designates unlimited time)
 fc = False
 mrv = False
@@ -18,6 +27,8 @@ lcv = True
 acp = False
 ac = False
 fcp = False
+cpp = False
+cp = False
 time_limit = 60
 
 ##### Console Display Settings #####
@@ -35,6 +46,16 @@ solver_export_solution = True
 solver_export_raw_data = True
 solver_export_data_summary = True
 
+##### Solver Batch Settings #####
+# solver_workers - Number of worker processes to solve puzzles with (1 solves every puzzle in the main process)
+#       Note: Realtime and verbose display are ignored when solving with more than 1 worker
+solver_workers = 1
+
+##### Solution Counting Settings #####
+# count_limit - Stop counting the solutions of a puzzle once this many have been found (Zero designates no limit)
+#       Note: With a limit of 2, a count of 1 means the puzzle has a unique solution
+count_limit = 2
+
 ##### Generator Settings #####
 # gen_how_many - Number of puzzles for the generator to attempt to produce
 # gen_time_limit - Generator timeout limit in seconds (Zero designates unlimited time)
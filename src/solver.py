@@ -15,10 +15,11 @@ __author__ = 'jshoham'
 # 1 0 0 0 4 0
 # 0 2 0 0 1 5
 #
-# Added support for a common representation of 9x9 puzzles, where each puzzle is represented
-# on a single line as a string of 81 characters. Each cell is represented by the digits 1-9
-# and blank cells are represented by '.'. For example, an input file containing three puzzles
-# might look like:
+# Added support for a common representation of puzzles, where each puzzle is represented
+# on a single line as a string of N*N characters. Each cell is represented by the digits 1-9
+# followed by the letters A-Z (so a 16x16 puzzle uses 1-9 and A-G), and blank cells are
+# represented by '.' (or '0'). The dimensions are inferred from the length of the line (see
+# grid.inline_dimensions). For example, an input file containing three 9x9 puzzles might look like:
 # 52...6.........7.13...........4..8..6......5...........418.........3..2...87.....
 # 4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......
 # 48.3............71.2.......7.5....6....2..8.............1.76...3.....4......5....
@@ -29,8 +30,11 @@ import sys
 import os
 import time
 import re
+import itertools
+import multiprocessing
 from random import sample
 import grid
+import dlx
 import rw
 import verifier
 import settings
@@ -38,7 +42,7 @@ import settings
 
 def puzzle_list(f_str):
     """Returns a list of strings with each element containing an individual puzzle."""
-    matches = re.findall(r'^([\d\.]+)$', f_str, re.MULTILINE)
+    matches = re.findall(r'^([\dA-Za-z\.]+)$', f_str, re.MULTILINE)
     if matches:  # inline representation
         return matches
     else:  # default representation
@@ -59,44 +63,18 @@ def puzzle_list(f_str):
         return p_list
 
 
-def create_board(board_str):
-    """Creates a single puzzle based on the given string representation."""
-    matches = re.match(r'^([\d\.]+)$', board_str, re.MULTILINE)
-    if matches:  # inline representation (81 chars on a line (9x9 puzzles only)
-        N, p, q = 9, 3, 3
-        board = grid.Grid(N, p, q)
-        for row in xrange(N):
-            for col in xrange(N):
-                cell_value = board_str[row * 9 + col]
-                cell_value = 0 if cell_value == '.' else int(cell_value)
-                board.assign(row, col, cell_value)
-        return board
-
-    else:  # default representation (first line 'N p q' followed by N lines)
-        row_list = board_str.splitlines()
-        N, p, q = [int(x) for x in row_list[0].split()]
-        board = grid.Grid(N, p, q)
-        for row in xrange(N):
-            col_list = [int(x) for x in row_list[row + 1].split()]
-            for col in xrange(N):
-                board.assign(row, col, col_list[col])
-        return board
-
+def create_board(board_str, first_line=1):
+    """Creates a single puzzle based on the given string representation.
 
-def choose_empty_cell(board):
-    """Returns the next empty cell as a tuple (row, col), or None if there are no more empty cells."""
-    if settings.mrv:
-        empty_cells = board.empty_cells()
-        return choose_cell_mrv(board, empty_cells)
-    elif settings.dh:
-        empty_cells = board.empty_cells()
-        return choose_cell_dh(board, empty_cells)
-    else:
-        for row in xrange(board.N):
-            for col in xrange(board.N):
-                if board.cell_empty(row, col):
-                    return row, col
-        return None
+    The string is validated while the board is built. If it is not a valid puzzle a ValueError is raised,
+    whose message gives the line of the problem, counting the first line of board_str as first_line.
+    """
+    N, p, q, cells = rw.puzzle_cells(board_str, first_line)
+    board = grid.Grid(N, p, q)
+    for i, cell_value in enumerate(cells):
+        if cell_value:
+            board.assign(i // N, i % N, cell_value)
+    return board
 
 
 def choose_cell_random(cell_list):
@@ -106,25 +84,6 @@ def choose_cell_random(cell_list):
     return sample(cell_list, 1)[0]
 
 
-def choose_cell_mrv(board, cell_list):
-    """Chooses the next empty cell which has the fewest possible remaining values.
-
-    Ties are broken arbitrarily, or by DH if it is turned on.
-    """
-    if not cell_list:
-        return None
-    mrv_cell = cell_list[0]
-    mrv_v = len(board.possible_values(*mrv_cell))
-    for cell in cell_list[1:]:  # Start with the 2nd cell
-        cell_v = len(board.possible_values(*cell))
-        if cell_v < mrv_v:
-            mrv_cell = cell
-            mrv_v = cell_v
-        elif cell_v == mrv_v and settings.dh:
-            mrv_cell = choose_cell_dh(board, [mrv_cell, cell])
-    return mrv_cell
-
-
 def choose_cell_dh(board, cell_list):
     """Chooses the cell from cell_list which has the highest degree to other unassigned cells.
 
@@ -145,199 +104,469 @@ def choose_cell_dh(board, cell_list):
     return dh_cell
 
 
-def order_possible_values(board, x, y):
-    """Returns the ordered domain of a given cell at (x, y)."""
-    if settings.lcv:
-        return order_values_lcv(board, x, y)
-    else:
-        return sorted(board.possible_values(x, y))
-
-
-# todo implement and test
 def order_values_lcv(board, x, y):
     """Order domain values based on the least constraining value.
     The least constraining value deletes the fewest values from peer domains."""
 
-    # lcv takes a value argument and computes its 'lcv' value, ie, how many values it would delete from peers
-    lcv = lambda value: len([peer for peer in board.peers(x, y)
-                             if board.cell_empty(*peer) and
-                             value in board.possible_values(*peer)])
-    return sorted(board.possible_values(x, y), key=lcv)
+    # The board keeps counts of how many empty peers still hold each value, ie, how many values each
+    # value would delete from peers
+    lcv = board.peer_supports(x, y)
+    return sorted(board.possible_values(x, y), key=lcv.__getitem__)
 
 
-# Alternate implementation. This one doesn't use a list comprehension for lcv so it might be faster (less mem alloc?)
+# Alternate implementation which counts constrained peers directly. Useful for testing and debugging.
 def order_values_lcv2(board, x, y):
     def lcv(value):
         lcv_value = 0
         for peer in board.peers(x, y):
-            if board.cell_empty(*peer) and value in board.possible_values(*peer):
+            if board.cell_empty(*peer) and board.is_possible_value(peer[0], peer[1], value):
                 lcv_value += 1
         return lcv_value
     return sorted(board.possible_values(x, y,), key=lcv)
 
 
-def infer(board, x, y, value):
-    viable = True
-    changed_list = []
-    if settings.fc:
-        fc_viable, fc_changed_list = board.forward_check(x, y, value)
-        changed_list += fc_changed_list
-        if not fc_viable:
-            return fc_viable, changed_list
-    if settings.ac:
-        ac_viable, ac_changed_list = board.arc_consistency()
-        changed_list += ac_changed_list
-        if not ac_viable:
-            return ac_viable, changed_list
-
-    return viable, changed_list
-
-
-def undo_infer(board, x, y, value, changed_list):
-    if settings.fc or settings.ac:
-        board.undo_changes(changed_list)
-
-
-def backtrack(board, history=None, start_time=None):
-    """This backtracking algorithm closely follows the model from Chapter 6 of Norvig's
-    'Artifical Intelligence: A Modern Approach 3rd Edition' A brief outline of the algorithm
-    is as follows:
-        1. Choose an empty cell (if there are no empty cells then return the board as it is completed)
-        2. Order the values in that cell's domain, then pick the first value to try
-        3. If the chosen value doesn't violate a constraint, assign it to that cell
-            (otherwise move to the next value in the ordering)
-        4. Perform any inferences based on that assignment
-        5. Perform backtrack() on the resulting board (recursion "magic" happens here!)
-        6. If backtrack returns a solution then return that solution, otherwise
-        7. Undo the assignment and inferences
-        8. Proceed to the next value in the ordering from step 2, then proceed to step 3
-        9. If there are no more values left in the ordering from step 2, then return None
-            (This step will go "one level up" in the recursion and land at step 6)
-    """
-    if not history:
-        history = []
-    if not start_time:
-        start_time = time.clock()
-    global assignment_count
-    global timeout
-
-    elapsed_time = time.clock() - start_time
-    if elapsed_time >= settings.time_limit and settings.time_limit != 0:
-        timeout = True
-        return board
+class Solver(object):
+    """A backtracking solver with its own heuristic settings and search statistics.
 
-    next_cell = choose_empty_cell(board)
-    if next_cell is None:
+    Any setting which is not given (or is None) is taken from the settings module when the solver is
+    created; later changes to the settings module do not affect an existing solver. Since all search
+    state lives on the solver, separate solvers can run side by side in threads or processes. A single
+    solver should only solve one puzzle at a time.
+    """
+    # Names of the settings a solver can be configured with
+    options = ('engine', 'fc', 'mrv', 'dh', 'lcv', 'acp', 'ac', 'fcp', 'cpp', 'cp', 'time_limit',
+               'solver_display_realtime', 'solver_display_verbose')
+
+    def __init__(self, **kwargs):
+        for name in kwargs:
+            if name not in Solver.options:
+                raise TypeError('Solver() got an unexpected keyword argument {!r}'.format(name))
+        for name in Solver.options:
+            value = kwargs.get(name)
+            setattr(self, name, getattr(settings, name) if value is None else value)
+
+        self.assignment_count = 0
+        self.solution_count = 0
+        self.timeout = False
+        self.unsolved_puzzle_str = ''
+        self.solution_header = ''
+
+    def configuration(self):
+        """Returns a dictionary of this solver's settings, which can be passed to Solver() to make a copy."""
+        return dict((name, getattr(self, name)) for name in Solver.options)
+
+    def choose_empty_cell(self, board):
+        """Returns the next empty cell as a tuple (row, col), or None if there are no more empty cells."""
+        if self.mrv:
+            return self.choose_cell_mrv(board)
+        elif self.dh:
+            empty_cells = board.empty_cells()
+            return choose_cell_dh(board, empty_cells)
+        else:
+            return board.first_empty_cell()
+
+    def choose_cell_mrv(self, board):
+        """Chooses the next empty cell which has the fewest possible remaining values.
+
+        Ties are broken by taking the first such cell in row major order, or by DH if it is turned on.
+        The board keeps its empty cells bucketed by domain size, so no scan of the board is needed.
+        """
+        if self.dh:
+            return choose_cell_dh(board, board.mrv_cells())
+        return board.mrv_cell()
+
+    def order_possible_values(self, board, x, y):
+        """Returns the ordered domain of a given cell at (x, y)."""
+        if self.lcv:
+            return order_values_lcv(board, x, y)
+        else:
+            return board.possible_values(x, y)  # already in ascending order
+
+    def infer(self, board, x, y, value):
+        """Performs any inferences that follow from assigning value to the cell at (x, y).
+
+        Returns True if the board is still viable. Changes are recorded on the board's trail, so they are
+        undone together with the assignment when backtrack rolls the board back.
+        """
+        if self.fc and not board.forward_check(x, y, value)[0]:
+            return False
+        if self.cp:  # constraint propagation includes arc consistency
+            if not board.propagate(incremental=True)[0]:
+                return False
+        elif self.ac and not board.arc_consistency(incremental=True)[0]:
+            return False
+        return True
+
+    def backtrack(self, board, start_time=None, solution_limit=1):
+        """This backtracking algorithm closely follows the model from Chapter 6 of Norvig's
+        'Artifical Intelligence: A Modern Approach 3rd Edition' A brief outline of the algorithm
+        is as follows:
+            1. Choose an empty cell (if there are no empty cells then return the board as it is completed)
+            2. Order the values in that cell's domain, then pick the first value to try
+            3. If the chosen value doesn't violate a constraint, assign it to that cell
+                (otherwise move to the next value in the ordering)
+            4. Perform any inferences based on that assignment
+            5. If the board is still viable, push the cell onto the choice stack and go to step 1
+            6. Otherwise, undo the assignment and inferences (by rolling the board back to a checkpoint)
+            7. Proceed to the next value in the ordering from step 2, then proceed to step 3
+            8. If there are no more values left in the ordering from step 2, pop the cell off the choice
+                stack, undo the assignment of the cell below it, and proceed to step 7 for that cell
+                (If the choice stack is empty then return None)
+
+        The choice stack replaces recursion, so the depth of the search is not limited by Python's
+        recursion limit. Each entry holds a cell, its ordered values, the position of the next value
+        to try, and the checkpoint taken before its current value was assigned.
+
+        Every complete assignment found is counted in solution_count. The search stops at the
+        solution_limit-th one (returning the board holding it), and otherwise carries on from step 6
+        as if the assignment had failed. A solution_limit of 0 counts every solution.
+        """
+        if not start_time:
+            start_time = time.clock()
+        verbose = self.solver_display_verbose
+        stack = []
+
+        while True:
+            # Steps 1 and 2: a new node in the search
+            elapsed_time = time.clock() - start_time
+            if elapsed_time >= self.time_limit and self.time_limit != 0:
+                self.timeout = True
+                return board
+
+            next_cell = self.choose_empty_cell(board)
+            if next_cell is None:
+                self.solution_count += 1
+                if self.solution_count == solution_limit:
+                    return board
+            else:
+                next_x, next_y = next_cell
+                values = self.order_possible_values(board, next_x, next_y)
+                if verbose:
+                    print "Possible values at ({},{}): {}".format(next_x, next_y, values)
+                stack.append([next_x, next_y, values, 0, None])
+
+            # Steps 3 to 8: find the next value to try, backing up the stack whenever a cell runs out
+            while stack:
+                frame = stack[-1]
+                next_x, next_y, values, index, mark = frame
+                if mark is not None:  # the search below this cell's current value failed
+                    board.rollback(mark)
+                    frame[4] = None
+                    if verbose:
+                        print 'removing {} from ({},{})'.format(values[index - 1], next_x, next_y)
+                        print board.display()
+
+                descend = False
+                while index < len(values):
+                    value = values[index]
+                    index += 1
+                    if verbose:
+                        print 'considering {} at ({},{})'.format(value, next_x, next_y)
+                    if board.violates_constraints(next_x, next_y, value):
+                        continue
+
+                    mark = board.checkpoint()
+                    board.assign(next_x, next_y, value)
+                    self.assignment_count += 1
+
+                    if verbose:
+                        print 'assigning {} to ({},{})'.format(value, next_x, next_y)
+                        print board.display()
+                    elif self.solver_display_realtime:
+                        os.system('CLS')
+                        frame_str = '\n'.join([self.unsolved_puzzle_str, self.solution_header, board.display()])
+                        sys.stdout.write(frame_str + '\n')
+                        sys.stdout.flush()
+
+                    if self.infer(board, next_x, next_y, value):
+                        frame[3] = index
+                        frame[4] = mark
+                        descend = True
+                        break
+                    board.rollback(mark)
+
+                    if verbose:
+                        print 'removing {} from ({},{})'.format(value, next_x, next_y)
+                        print board.display()
+
+                if descend:
+                    break
+                if verbose:
+                    print 'ran out of values to consider for ({},{})'.format(next_x, next_y)
+                stack.pop()
+            else:
+                return None
+
+    def solve(self, board, start_time=None):
+        """Searches for a solution to board with the configured engine, resetting this solver's statistics
+        first.
+
+        Returns the solved board (or with the 'csp' engine, the partially filled board on timeout), or None
+        if there is no solution.
+        """
+        self.assignment_count = 0
+        self.solution_count = 0
+        self.timeout = False
+        if self.engine == 'dlx':
+            return self.solve_dlx(board, start_time)
+        return self.backtrack(board, start_time)
+
+    def count_solutions(self, board, limit=2, start_time=None):
+        """Counts the solutions of board with the configured engine, stopping once limit solutions have been
+        found (0 counts them all). So with the default limit, 1 means the puzzle has a unique solution.
+
+        The board is left as it was given. On timeout the count so far is returned and timeout is set.
+        """
+        self.assignment_count = 0
+        self.solution_count = 0
+        self.timeout = False
+        if self.engine == 'dlx':
+            self.solution_count, self.assignment_count, self.timeout = dlx.count_solutions(
+                board, limit, self.time_limit, start_time)
+        else:
+            mark = board.checkpoint()
+            self.backtrack(board, start_time, limit)
+            board.rollback(mark)
+        return self.solution_count
+
+    def solve_dlx(self, board, start_time=None):
+        """Searches for a solution to board as an exact cover problem with Dancing Links (see dlx.solve).
+
+        Each row chosen by the search counts as an assignment. None of the backtracking heuristics apply,
+        but any pre-processing has already shrunk the domains the cover matrix is built from.
+        """
+        board, self.assignment_count, self.timeout = dlx.solve(board, self.time_limit, start_time)
+        self.solution_count = 1 if board else 0
         return board
-    next_x, next_y = next_cell
-
-    if settings.solver_display_verbose:
-        print "Possible values at ({},{}): {}".format(next_x, next_y, order_possible_values(board, next_x, next_y))
-    for value in order_possible_values(board, next_x, next_y):
-        if settings.solver_display_verbose:
-            print 'considering {} at ({},{})'.format(value, next_x, next_y)
-        if not board.violates_constraints(next_x, next_y, value):
-            board.assign(next_x, next_y, value)
-            assignment_count += 1
-
-            if settings.solver_display_verbose:
-                print 'assigning {} to ({},{})'.format(value, next_x, next_y)
-                print board.display()
-            elif settings.solver_display_realtime:
-                os.system('CLS')
-                frame = '\n'.join([unsolved_puzzle_str, solution_header, board.display()])
-                sys.stdout.write(frame + '\n')
-                sys.stdout.flush()
-
-            viable, inferences = infer(board, next_x, next_y, value)
-            if viable:
-                history.append(inferences)
-                result = backtrack(board, history, start_time)
-                if result:
-                    return result
-                inferences = history.pop()
-            undo_infer(board, next_x, next_y, value, inferences)
-            board.undo_assign(next_x, next_y)
-
-            if settings.solver_display_verbose:
-                print 'removing {} from ({},{})'.format(value, next_x, next_y)
-                print board.display()
-
-    if settings.solver_display_verbose:
-        print 'ran out of values to consider for ({},{})'.format(next_x, next_y)
-    return None
-
 
-def solve(board, start_time=None):
-    return backtrack(board, [], start_time)
-
-
-def solve_puzzles(board_list):
-    global assignment_count
-    global timeout
-    global unsolved_puzzle_str
-    global solution_header
-    global solution_str
-    global raw_data_log
-    global solution_log
-
-    pnum = 1
-    ptotal = len(board_list)
-    solution_str = ''
-    for each in board_list:
-        if settings.solver_display_realtime and not settings.solver_display_verbose:
+    def preprocess(self, board):
+        """Applies the configured pre-processing (ACP, FCP and CPP) to board. Returns True if the board is
+        still viable."""
+        viable = True
+        # ACP, FCP and CPP toss their 2nd return values (checkpoints) because as pre-processes, there is no reason
+        # to undo anything
+        if self.acp:
+            viable *= board.arc_consistency()[0]
+        if self.fcp:
+            for row in xrange(board.N):
+                for col in xrange(board.N):
+                    if board.cell_filled(row, col):
+                        viable *= board.forward_check(row, col, board.cell_value(row, col))[0]
+        if self.cpp and viable:
+            viable *= board.propagate()[0]
+        return viable
+
+    def count_puzzle(self, board_str, limit=2, first_line=1):
+        """Counts the solutions of a single puzzle given by its string representation, up to limit (see
+        count_solutions), after the configured pre-processing. Raises ValueError if board_str is not a valid
+        puzzle (see create_board)."""
+        start_time = time.clock()
+        board = create_board(board_str, first_line)
+        self.assignment_count = 0
+        self.solution_count = 0
+        self.timeout = False
+        if self.preprocess(board):
+            self.count_solutions(board, limit, start_time)
+        return self.solution_count
+
+    def solve_puzzle(self, board_str, pnum=1, ptotal=1, display=True, first_line=1):
+        """Solves a single puzzle given by its string representation.
+
+        Returns the displayed puzzle, the displayed solution (with its statistics), and the raw data entry
+        for the puzzle. If display is False nothing is printed to the console. Raises ValueError if
+        board_str is not a valid puzzle (see create_board).
+        """
+        realtime = display and self.solver_display_realtime and not self.solver_display_verbose
+        if realtime:
             os.system('CLS')  # Clear out old console output if realtime is on
 
         time_overall_start = time.clock()
-        assignment_count = 0
-        timeout = False
-        viable = True
+        self.assignment_count = 0
+        self.timeout = False
 
-        board = create_board(each)
+        board = create_board(board_str, first_line)
 
         puzzle_header = '==Puzzle {}/{}=='.format(pnum, ptotal).center(2 * board.N, '=')
-        solution_header = '==Solution {}/{}=='.format(pnum, ptotal).center(2 * board.N, '=')
-        unsolved_puzzle_str = '\n'.join([puzzle_header, board.display()])
-        print unsolved_puzzle_str
+        self.solution_header = '==Solution {}/{}=='.format(pnum, ptotal).center(2 * board.N, '=')
+        self.unsolved_puzzle_str = '\n'.join([puzzle_header, board.display()])
+        if display:
+            print self.unsolved_puzzle_str
 
-        # ACP and FCP toss their 2nd return values (changed_list) because as pre-processes, there is no reason
-        # to undo anything and therefore no reason to keep the changed_lists
-        if settings.acp:
-            viable *= board.arc_consistency()[0]
-        if settings.fcp:
-            for row in xrange(board.N):
-                for col in xrange(board.N):
-                    if board.cell_filled(row, col):
-                        viable *= board.forward_check(row, col, board.cell_value(row, col))[0]
+        viable = self.preprocess(board)
 
         time_search_start = time.clock()
-        if viable:  # Skip attempting to solve if ACP or FCP finds the board not viable
-            board = solve(board, time_search_start)
+        if viable:  # Skip attempting to solve if ACP, FCP or CPP finds the board not viable
+            board = self.solve(board, time_search_start)
         time_end = time.clock()
         solved = board.solved() if board else False
 
-        if settings.solver_display_realtime and not settings.solver_display_verbose:
+        if realtime:
             os.system('CLS')  # Clear out old console output if realtime is on
-            print unsolved_puzzle_str
+            print self.unsolved_puzzle_str
 
-        solution_str = '\n'.join([solution_header,
+        solution_str = '\n'.join([self.solution_header,
                                   board.display() if solved else 'No Solution Found.',
                                   'Time: ' + str(1000 * (time_end - time_search_start)),
-                                  'Assignments: ' + str(assignment_count),
+                                  'Assignments: ' + str(self.assignment_count),
                                   'Solution: ' + ('Yes' if solved else 'No'),
-                                  'Timeout: ' + ('Yes' if timeout else 'No')])
+                                  'Timeout: ' + ('Yes' if self.timeout else 'No')])
+        if display:
+            print solution_str
+
+        data_entry = (1000 * time_overall_start, 1000 * time_search_start, 1000 * time_end,
+                      self.assignment_count, solved, self.timeout)
+        return self.unsolved_puzzle_str, solution_str, data_entry
+
+
+def solve(board, start_time=None):
+    """Solves board with a new Solver configured from the settings module."""
+    return Solver().solve(board, start_time)
+
+
+def _load_puzzle(board_str):
+    """Returns the puzzle string of a job, reading it from its packed puzzle file if it is given as a
+    (file_path, index) pair."""
+    if isinstance(board_str, tuple):
+        file_path, index = board_str
+        return rw.open_packed(file_path)[index]
+    return board_str
+
+
+def _solve_puzzle_worker(job):
+    configuration, board_str, pnum, ptotal, first_line = job
+    try:
+        return Solver(**configuration).solve_puzzle(_load_puzzle(board_str), pnum, ptotal, False, first_line)
+    except ValueError as e:
+        return None, str(e), None
+
+
+def _count_puzzle_worker(job):
+    configuration, board_str, limit, first_line = job
+    board_str = _load_puzzle(board_str)
+    solver = Solver(**configuration)
+    try:
+        return board_str, solver.count_puzzle(board_str, limit, first_line), solver.timeout
+    except ValueError as e:
+        return None, str(e), None
+
+
+def _numbered_puzzles(board_list, packed_refs=False):
+    """Yields (pnum, first_line, board_str) for each puzzle in board_list, which may hold either puzzle
+    strings or (first_line, board_str) pairs as yielded by rw.iter_puzzles. If packed_refs is set and
+    board_list is an rw.PackedPuzzles, board_str is a (file_path, index) pair instead, so that worker
+    processes can read the puzzle from the file themselves."""
+    if packed_refs and isinstance(board_list, rw.PackedPuzzles):
+        for index in xrange(len(board_list)):
+            yield index + 1, 1, (board_list.file_path, index)
+        return
+    for pnum, each in enumerate(board_list, 1):
+        if isinstance(each, basestring):
+            yield pnum, 1, each
+        else:
+            yield (pnum,) + tuple(each)
+
+
+def _imap_in_batches(function, jobs, workers):
+    """Maps function over jobs with a pool of worker processes, yielding each job with its result in order.
+    The jobs are handed to the pool in batches, since the pool would otherwise read all of them up front."""
+    batch_size = 256 * workers
+    pool = multiprocessing.Pool(workers)
+    try:
+        while True:
+            batch = list(itertools.islice(jobs, batch_size))
+            if not batch:
+                break
+            chunksize = max(1, len(batch) // (4 * workers))
+            for job_result in itertools.izip(batch, pool.imap(function, batch, chunksize)):
+                yield job_result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def solve_puzzles(board_list, solver=None, workers=None, ptotal=None):
+    """Solves every puzzle string in board_list with solver (by default a Solver configured from the
+    settings module). Yields the displayed puzzle, displayed solution and raw data entry of each puzzle,
+    in the same order as board_list.
+
+    board_list can be any iterable, including a generator such as rw.iter_puzzles or an rw.PackedPuzzles
+    (whose puzzles the worker processes then read from the file themselves), and is only read as far as
+    needed, so the puzzles never have to be held in memory all at once. ptotal is the number of puzzles
+    shown in the puzzle headers; by default it is len(board_list) if board_list has a length.
+    Each puzzle is validated as its board is created. Invalid puzzles are reported, with the line of the
+    problem when board_list holds (first_line, board_str) pairs, and skipped.
+
+    If workers (by default settings.solver_workers) is greater than 1, the puzzles are distributed
+    across that many worker processes, each solving with its own copy of solver. Each worker applies
+    the solver's time limit to each of its puzzles, and results are printed by this process as they
+    arrive, in order. Realtime and verbose display are only available when solving in a single process.
+    """
+    if solver is None:
+        solver = Solver()
+    if workers is None:
+        workers = settings.solver_workers
+    if ptotal is None:
+        ptotal = len(board_list) if hasattr(board_list, '__len__') else '?'
+
+    skip_msg = 'Skipping puzzle {}/{}. {}'
+    if workers <= 1:
+        for pnum, first_line, each in _numbered_puzzles(board_list):
+            try:
+                result = solver.solve_puzzle(each, pnum, ptotal, True, first_line)
+            except ValueError as e:
+                print skip_msg.format(pnum, ptotal, e)
+                continue
+            yield result
+        return
+
+    configuration = solver.configuration()
+    jobs = ((configuration, each, pnum, ptotal, first_line)
+            for pnum, first_line, each in _numbered_puzzles(board_list, packed_refs=True))
+    for job, result in _imap_in_batches(_solve_puzzle_worker, jobs, workers):
+        unsolved_puzzle_str, solution_str, data_entry = result
+        if unsolved_puzzle_str is None:
+            print skip_msg.format(job[2], ptotal, solution_str)
+            continue
+        print unsolved_puzzle_str
         print solution_str
+        yield result
 
-        if settings.solver_export_solution:
-            solution_log.append((unsolved_puzzle_str, solution_str))
 
-        if settings.solver_export_raw_data or settings.solver_export_data_summary:
-            data_entry = (1000 * time_overall_start, 1000 * time_search_start, 1000 * time_end,
-                          assignment_count, solved, timeout)
-            raw_data_log.append(data_entry)
-        pnum += 1
-    return
+def count_puzzles(board_list, solver=None, limit=None, workers=None):
+    """Counts the solutions of every puzzle in board_list with solver (by default a Solver configured from
+    the settings module), stopping at limit solutions per puzzle (by default settings.count_limit).
+    Yields the puzzle number, puzzle string, solution count and whether the count timed out for each
+    puzzle, in the same order as board_list.
 
+    board_list, workers and invalid puzzles are handled the same way as by solve_puzzles.
+    """
+    if solver is None:
+        solver = Solver()
+    if limit is None:
+        limit = settings.count_limit
+    if workers is None:
+        workers = settings.solver_workers
+
+    skip_msg = 'Skipping puzzle {}. {}'
+    if workers <= 1:
+        for pnum, first_line, each in _numbered_puzzles(board_list):
+            try:
+                count = solver.count_puzzle(each, limit, first_line)
+            except ValueError as e:
+                print skip_msg.format(pnum, e)
+                continue
+            yield pnum, each, count, solver.timeout
+        return
+
+    configuration = solver.configuration()
+    jobs = ((configuration, each, limit, first_line)
+            for pnum, first_line, each in _numbered_puzzles(board_list, packed_refs=True))
+    results = _imap_in_batches(_count_puzzle_worker, jobs, workers)
+    for pnum, (job, (board_str, count, timeout)) in enumerate(results, 1):
+        if board_str is None:
+            print skip_msg.format(pnum, count)
+            continue
+        yield pnum, board_str, count, timeout
 
 
 def main(*args):
@@ -346,41 +575,61 @@ def main(*args):
         exit(-1)
 
     input_filepath = args[0]
-    global raw_data_log
-    global solution_log
 
-    raw_data_log = [('time_overall_start', 'time_search_start', 'time_end', 'assignments', 'solution', 'timeout')]
-    solution_log = []
-
-    f_str = rw.read_file(input_filepath)
-    if not verifier.valid_puzzles(f_str):
+    root, ext = os.path.splitext(input_filepath)
+    if rw.is_packed_file(input_filepath):
+        puzzles = rw.PackedPuzzles(input_filepath)
+        ptotal = len(puzzles)
+        ext = '.txt'  # the output files are text
+    else:
+        # The file is read twice, first to count the puzzles (which needs no parsing), then to validate and
+        # solve them, so that only one puzzle at a time needs to be held in memory.
+        puzzles = rw.iter_puzzles(input_filepath)
+        ptotal = sum(1 for _ in rw.iter_puzzles(input_filepath))
+
+    raw_data_header = ('time_overall_start', 'time_search_start', 'time_end', 'assignments', 'solution', 'timeout')
+
+    # Results are written to the output files as soon as each puzzle is solved. The files are opened with
+    # the first valid puzzle, so that nothing is written for a file without any.
+    solution_file = data_file = None
+    solver = Solver()
+    totals = [0] * len(raw_data_header)
+    count = 0
+    try:
+        for unsolved_puzzle_str, solution_str, data_entry in solve_puzzles(puzzles, solver, ptotal=ptotal):
+            if not count:
+                if settings.solver_export_solution:
+                    solution_file = rw.open_output_file(root + '_solution' + ext)
+                if settings.solver_export_raw_data:
+                    data_file = rw.open_output_file(root + '_raw_data' + ext)
+                    data_file.write('\t'.join(raw_data_header))
+            if solution_file:
+                if count:
+                    solution_file.write('\n')
+                solution_file.write('\n'.join((unsolved_puzzle_str, solution_str)))
+                solution_file.flush()
+            if data_file:
+                data_file.write('\n' + '\t'.join(str(item).ljust(len(header))
+                                                  for item, header in zip(data_entry, raw_data_header)))
+                data_file.flush()
+            totals = [total + item for total, item in zip(totals, data_entry)]
+            count += 1
+    finally:
+        if solution_file:
+            solution_file.close()
+        if data_file:
+            data_file.close()
+
+    if not count:
         print 'Input file does not contain puzzle(s) in a valid format.'
         exit(-1)
-    puzzles = puzzle_list(f_str)
-
-    solve_puzzles(puzzles)
-
-    root, ext = os.path.splitext(input_filepath)
-
-    if settings.solver_export_solution:
-        solution_file_path = root + '_solution' + ext
-        solution_str = '\n'.join('\n'.join(entry) for entry in solution_log)
-        rw.write_file(solution_file_path, solution_str)
-
-    if settings.solver_export_raw_data:
-        data_file_path = root + '_raw_data' + ext
-        str_data_log = [[str(item) for item in entry] for entry in raw_data_log]
-        str_data_log = rw.adjust_col_widths(str_data_log)
-        data_str = '\n'.join('\t'.join(entry) for entry in str_data_log)
-        rw.write_file(data_file_path, data_str)
 
     if settings.solver_export_data_summary:
         data_summary_file_path = root + '_data_summary' + ext
-        summary_header = 'Average Data for {} Puzzles'.format(len(raw_data_log) - 1)
+        summary_header = 'Average Data for {} Puzzles'.format(count)
         summary_divider = '-' * len(summary_header)
 
-        averages = [sum(category) / float(len(category)) for category in zip(*raw_data_log[1:])]
-
+        averages = [total / float(count) for total in totals]
         total_time = 'Total Time:'.ljust(21) + format(averages[2] - averages[0], '.2f')
         init_time = 'Initialization Time:'.ljust(21) + format(averages[1] - averages[0], '.2f')
         search_time = 'Search Time:'.ljust(21) + format(averages[2] - averages[1], '.2f')
@@ -389,16 +638,19 @@ def main(*args):
         timeouts = 'Timeout Frequency:'.ljust(21) + format(averages[5], '.3f')
 
         settings_str = 'Settings:' \
-                       '\nForward Checking: ' + str(settings.fc) + \
-                       '\nMinimum Remaining Values: ' + str(settings.mrv) + \
-                       '\nDegree Heuristic: ' + str(settings.dh) + \
-                       '\nLeast Constraining Value: ' + str(settings.lcv) + \
-                       '\nArc Consistency Pre-Processing: ' + str(settings.acp) + \
-                       '\nArc Consistency: ' + str(settings.ac) + \
+                       '\nSearch Engine: ' + solver.engine + \
+                       '\nForward Checking: ' + str(solver.fc) + \
+                       '\nMinimum Remaining Values: ' + str(solver.mrv) + \
+                       '\nDegree Heuristic: ' + str(solver.dh) + \
+                       '\nLeast Constraining Value: ' + str(solver.lcv) + \
+                       '\nArc Consistency Pre-Processing: ' + str(solver.acp) + \
+                       '\nArc Consistency: ' + str(solver.ac) + \
+                       '\nConstraint Propagation Pre-Processing: ' + str(solver.cpp) + \
+                       '\nConstraint Propagation: ' + str(solver.cp) + \
                        '\n' + summary_divider + \
                        '\nDisplay Settings:' + \
-                       '\nRealtime: ' + str(settings.solver_display_realtime) + \
-                       '\nVerbose: ' + str(settings.solver_display_verbose)
+                       '\nRealtime: ' + str(solver.solver_display_realtime) + \
+                       '\nVerbose: ' + str(solver.solver_display_verbose)
 
         data_summary_str = '\n'.join((summary_header, summary_divider,
                                       total_time, init_time, search_time,
@@ -2,36 +2,47 @@
 
 
 import re
+import grid
 import settings
 
 # Verify that all settings have valid parameters
+# engine = 'csp'|'dlx'
 # fc = True|False
 # mrv = True|False
 # dh = True|False
 # lcv = True|False
 # acp = True|False
 # ac = True|False
+# cpp = True|False
+# cp = True|False
 # time_limit = Number greater or equal to 0
 # solver_display = True|False
 # solver_verbose = True|False
 # solver_export_solution = True|False
 # solver_export_raw_data = True|False
 # solver_export_data_summary = True|False
+# solver_workers = Integer greater than 0
+# count_limit = Integer greater or equal to 0
 # gen_how_many = Integer greater than 0
 # gen_time_limit = Number greater or equal to 0
 def user_settings():
-    defaults = {'fc': True,
+    defaults = {'engine': 'csp',
+                'fc': True,
                 'mrv': True,
                 'dh': True,
                 'lcv': False,
                 'acp': True,
                 'ac': False,
+                'cpp': False,
+                'cp': False,
                 'time_limit': 60,
                 'solver_display_realtime': False,
                 'solver_display_verbose': False,
                 'solver_export_solution': True,
                 'solver_export_raw_data': True,
                 'solver_export_data_summary': True,
+                'solver_workers': 1,
+                'count_limit': 2,
                 'gen_how_many': 1,
                 'gen_time_limit': 5}
 
@@ -39,6 +50,9 @@ def user_settings():
         print 'Invalid value for <settings.{}> (Acceptable values: {}). ' \
               'Defaulting to {}.'.format(s, acceptable_values, defaults[s])
 
+    if settings.engine not in ('csp', 'dlx'):
+        settings.engine = defaults['engine']
+        msg('engine', "'csp'|'dlx'")
     if type(settings.fc) is not bool:
         settings.fc = defaults['fc']
         msg('fc', 'True|False')
@@ -57,6 +71,12 @@ def user_settings():
     if type(settings.ac) is not bool:
         settings.ac = defaults['ac']
         msg('ac', 'True|False')
+    if type(settings.cpp) is not bool:
+        settings.cpp = defaults['cpp']
+        msg('cpp', 'True|False')
+    if type(settings.cp) is not bool:
+        settings.cp = defaults['cp']
+        msg('cp', 'True|False')
     if (not isinstance(settings.time_limit, (int, long, float))) or settings.time_limit < 0:
         settings.time_limit = defaults['time_limit']
         msg('time_limit', 'Number greater or equal to zero')
@@ -78,6 +98,14 @@ def user_settings():
         settings.solver_export_data_summary = defaults['solver_export_data_summary']
         msg('solver_export_data_summary', 'True|False')
 
+    if (not isinstance(settings.solver_workers, (int, long))) or settings.solver_workers < 1:
+        settings.solver_workers = defaults['solver_workers']
+        msg('solver_workers', 'Integer greater than 0')
+
+    if (not isinstance(settings.count_limit, (int, long))) or settings.count_limit < 0:
+        settings.count_limit = defaults['count_limit']
+        msg('count_limit', 'Integer greater or equal to zero')
+
     if (not isinstance(settings.gen_how_many, (int, long))) or settings.gen_how_many < 1:
         settings.gen_how_many = defaults['gen_how_many']
         msg('gen_how_many', 'Integer greater than 0')
@@ -159,16 +187,34 @@ def board_default(s):
     return True if verified else False
 
 
-# Board inline representation (9x9 puzzles only):
-# A puzzle is represented on a single line 81 characters long. Each character is either the digits
-# 1-9 or a '.' to represent blank cells. A file can contain an arbitrary number of puzzles.
-# For example a file containing three puzzles might look like:
+# Board inline representation:
+# A puzzle is represented on a single line N*N characters long, where N is the number of tokens (and
+# the dimensions of the boxes follow from N, see grid.inline_dimensions). Each character is one of
+# the first N characters of 1-9 followed by A-Z, or a '.' or '0' to represent blank cells. A file can
+# contain an arbitrary number of puzzles. For example a file containing three 9x9 puzzles might look like:
 # 52...6.........7.13...........4..8..6......5...........418.........3..2...87.....
 # 4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......
 # 48.3............71.2.......7.5....6....2..8.............1.76...3.....4......5....
 def board_inline(s):
-    matches = re.match(r'^([\d\.]{81})(\n[\d\.]{81})*\s*$', s)
-    return True if matches else False
+    if not re.match(r'^[\dA-Za-z\.]+(\n[\dA-Za-z\.]+)*\s*$', s):
+        return False
+    for line in s.split():
+        if not inline_line(line):
+            return False
+    return True
+
+
+def inline_line(line):
+    """Returns True if line is a single puzzle in the inline representation."""
+    dimensions = grid.inline_dimensions(len(line))
+    if dimensions is None:
+        return False
+    N = dimensions[0]
+    token_values = grid.TOKEN_VALUES
+    for char in line:
+        if token_values.get(char, N + 1) > N:
+            return False
+    return True
 
 
 # a file string contains valid puzzles if they are in either the inline representation or the
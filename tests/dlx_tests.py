@@ -0,0 +1,25 @@
+from nose.tools import *
+from src.dlx import *
+
+
+def test_search():
+    # Knuth's example: the only exact cover is rows 0, 3 and 4
+    rows = [[2, 4, 5], [0, 3, 6], [1, 2, 5], [0, 3], [1, 6], [3, 4, 6]]
+    links = DancingLinks(7, rows)
+    assert_equals(sorted(links.search()), [0, 3, 4])
+    assert_false(links.timeout)
+
+    # No exact cover, and the empty matrix
+    assert_equals(DancingLinks(3, [[0, 1], [1, 2]]).search(), None)
+    assert_equals(DancingLinks(0, []).search(), [])
+
+
+def test_cover_uncover():
+    links = DancingLinks(3, [[0, 1], [1, 2], [0, 2]])
+    state = (list(links.L), list(links.R), list(links.U), list(links.D), list(links.S))
+    links.cover(2)  # header 2 is column 1, removing rows 0 and 1 from columns 0 and 2
+    assert_equals(links.S[1:], [1, 2, 1])
+    links.cover(1)
+    links.uncover(1)
+    links.uncover(2)
+    assert_equals((links.L, links.R, links.U, links.D, links.S), state)
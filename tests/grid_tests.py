@@ -8,16 +8,241 @@ def test_reset():
 
     for row in xrange(N):
         for col in xrange(N):
-            board.grid[row][col].possible_values.discard(1)
+            board.eliminate(row, col, 1)
             board.reset(row, col)
-            assert_equals(board.grid[row][col].possible_values, set(xrange(1, N + 1)))
+            assert_equals(board.possible_values(row, col), range(1, N + 1))
 
     for row in xrange(N):
         for col in xrange(N):
-            board.grid[row][col].possible_values.discard(1)
+            board.eliminate(row, col, 1)
 
     board.reset()
 
     for row in xrange(N):
         for col in xrange(N):
-            assert_equals(board.grid[row][col].possible_values, set(xrange(1, N + 1)))
+            assert_equals(board.possible_values(row, col), range(1, N + 1))
+
+
+def test_eliminate():
+    N, p, q = 6, 2, 3
+    board = Grid(N, p, q)
+
+    board.eliminate(2, 4, 3)
+    board.eliminate(2, 4, 3)  # eliminating a value twice has no further effect
+    board.eliminate(2, 4, 6)
+    assert_equals(board.possible_values(2, 4), [1, 2, 4, 5])
+    assert_equals(board.domain_size(2, 4), 4)
+    assert_false(board.is_possible_value(2, 4, 6))
+
+    board.undo_eliminate(2, 4, 6)
+    assert_equals(board.possible_values(2, 4), [1, 2, 4, 5, 6])
+    assert_equals(board.domain_size(2, 4), 5)
+
+
+def test_popcount():
+    assert_equals(popcount(0), 0)
+    assert_equals(popcount(0b1010), 2)
+    assert_equals(popcount((1 << 26) - 2), 25)
+    assert_equals(mask_values(0b1010), [1, 3])
+
+
+def test_geometry():
+    geometry = get_geometry(6, 2, 3)
+    assert_true(geometry is get_geometry(6, 2, 3))
+    assert_true(Grid(6, 2, 3).geometry is geometry)
+
+    assert_equals(geometry.boxes[1], [3, 4, 5, 9, 10, 11])
+    assert_equals(geometry.cell_units[10], (1, 6 + 4, 12 + 1))
+    assert_equals(geometry.peer_cells[10],
+                  [(0, 3), (0, 4), (0, 5), (1, 3), (1, 5),
+                   (1, 0), (1, 1), (1, 2),
+                   (2, 4), (3, 4), (4, 4), (5, 4)])
+    for i in xrange(36):
+        assert_equals(len(geometry.peers[i]), 12)
+
+
+def test_constraints():
+    N, p, q = 4, 2, 2
+    board = Grid(N, p, q)
+    for row, line in enumerate([[1, 2, 3, 4], [3, 4, 1, 2], [2, 1, 4, 3], [4, 3, 2, 0]]):
+        for col, value in enumerate(line):
+            board.assign(row, col, value)
+
+    assert_true(board.verify())
+    assert_false(board.solved())
+    assert_true(board.violates_constraints(3, 3, 2))
+    assert_false(board.violates_constraints(3, 3, 1))
+    assert_false(board.violates_constraints(0, 0, 1))  # a cell never conflicts with its own token
+    assert_equals(board.used_values(3, 3), 0b11100)
+
+    board.assign(3, 3, 2)
+    assert_false(board.verify())
+    board.assign(3, 3, 1)
+    assert_true(board.solved())
+    board.undo_assign(3, 3)
+    assert_true(board.verify())
+    assert_false(board.solved())
+
+
+def test_rollback():
+    N, p, q = 4, 2, 2
+    board = Grid(N, p, q)
+    board.assign(0, 0, 1)
+    mark = board.checkpoint()
+
+    board.assign(1, 2, 1)
+    viable, changes = board.forward_check(1, 2, 1)
+    assert_true(viable)
+    assert_false(board.is_possible_value(1, 3, 1))
+    assert_false(board.is_possible_value(3, 2, 1))
+    board.eliminate(2, 2, 4)
+
+    board.rollback(mark)
+    assert_equals(board.cell_value(1, 2), 0)
+    assert_equals(board.cell_value(0, 0), 1)
+    assert_equals(board.checkpoint(), mark)
+    for row in xrange(N):
+        for col in xrange(N):
+            assert_equals(board.possible_values(row, col), [1, 2, 3, 4])
+            assert_equals(board.domain_size(row, col), 4)
+    assert_false(board.violates_constraints(1, 2, 1))
+
+
+def test_arc_consistency_incremental():
+    puzzle = '4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......'
+
+    incremental_board = Grid(9, 3, 3)
+    full_board = Grid(9, 3, 3)
+    for board in (incremental_board, full_board):
+        for i, value in enumerate(puzzle):
+            board.assign(i // 9, i % 9, 0 if value == '.' else int(value))
+        assert_true(board.arc_consistency()[0])
+
+    marks = []
+    for step in xrange(3):
+        # assign the first possible value of the first undecided cell
+        i = [j for j in xrange(81) if full_board.tokens[j] == 0 and full_board.domain_sizes[j] > 1][0]
+        x, y, value = i // 9, i % 9, full_board.possible_values(i // 9, i % 9)[0]
+        marks.append(incremental_board.checkpoint())
+        incremental_board.assign(x, y, value)
+        full_board.assign(x, y, value)
+        incremental_viable = incremental_board.arc_consistency(incremental=True)[0]
+        full_viable = full_board.arc_consistency()[0]
+        assert_equals(incremental_viable, full_viable)
+        assert_equals(incremental_board.domains, full_board.domains)
+
+    # After rolling back, the incremental queue must be seeded from the restored consistent state
+    incremental_board.rollback(marks[-1])
+    incremental_board.assign(x, y, value)
+    assert_equals(incremental_board.arc_consistency(incremental=True)[0], full_viable)
+    assert_equals(incremental_board.domains, full_board.domains)
+
+
+def test_mrv_cells():
+    N, p, q = 4, 2, 2
+    board = Grid(N, p, q)
+    assert_equals(board.first_empty_cell(), (0, 0))
+    assert_equals(board.mrv_cell(), (0, 0))
+
+    mark = board.checkpoint()
+    board.assign(0, 0, 1)
+    board.forward_check(0, 0, 1)
+    board.eliminate(3, 3, 2)
+    assert_equals(board.first_empty_cell(), (0, 1))
+    assert_equals(board.mrv_cell(), (0, 1))
+    assert_equals(board.mrv_cells(), [(0, 1), (0, 2), (0, 3), (1, 0), (1, 1), (2, 0), (3, 0), (3, 3)])
+
+    board.eliminate(2, 2, 3)
+    board.eliminate(2, 2, 4)
+    assert_equals(board.mrv_cells(), [(2, 2)])
+
+    board.rollback(mark)
+    assert_equals(board.mrv_cells(), board.empty_cells())
+    assert_equals(len(board.empty_cells()), 16)
+
+
+def test_degree_heuristic():
+    def counted_degree(board, x, y):
+        return len([(row, col) for (row, col) in board.peers(x, y)
+                    if board.cell_empty(row, col) and board.domain_size(row, col) > 1])
+
+    N, p, q = 6, 2, 3
+    board = Grid(N, p, q)
+    assert_equals(board.degree_heuristic(0, 0), 12)
+
+    mark = board.checkpoint()
+    board.assign(0, 0, 1)
+    board.forward_check(0, 0, 1)
+    board.assign(1, 4, 2)
+    board.forward_check(1, 4, 2)
+    for value in (1, 2, 3, 4):
+        board.eliminate(0, 4, value)  # only 5 and 6 left, so (0, 4) still counts
+    board.eliminate(0, 4, 5)  # only 6 left, so (0, 4) no longer counts
+    for row in xrange(N):
+        for col in xrange(N):
+            assert_equals(board.degree_heuristic(row, col), counted_degree(board, row, col))
+
+    board.rollback(mark)
+    for row in xrange(N):
+        for col in xrange(N):
+            assert_equals(board.degree_heuristic(row, col), 12)
+
+
+def test_peer_supports():
+    N, p, q = 6, 2, 3
+    board = Grid(N, p, q)
+    mark = board.checkpoint()
+    for x, y, value in [(0, 0, 1), (1, 4, 2), (3, 3, 1), (5, 1, 6)]:
+        board.assign(x, y, value)
+        board.forward_check(x, y, value)
+    board.eliminate(2, 2, 3)
+    board.eliminate(0, 1, 5)
+
+    for row in xrange(N):
+        for col in xrange(N):
+            supports = board.peer_supports(row, col)
+            for value in board.possible_values(row, col):
+                counted = len([peer for peer in board.peers(row, col)
+                               if board.cell_empty(*peer) and board.is_possible_value(peer[0], peer[1], value)])
+                assert_equals(supports[value], counted)
+
+    board.rollback(mark)
+    assert_equals(board.value_support, Grid(N, p, q).value_support)
+
+
+def test_propagate():
+    # Hidden single: 1 can only go in the top left cell of the first row
+    board = Grid(4, 2, 2)
+    board.assign(1, 2, 1)
+    board.assign(2, 1, 1)
+    assert_true(board.propagate()[0])
+    assert_equals(board.possible_values(0, 0), [1])
+
+    # Naked pair: the first two cells of the first row can only hold 1 and 2
+    board = Grid(4, 2, 2)
+    for y in (0, 1):
+        board.eliminate(0, y, 3)
+        board.eliminate(0, y, 4)
+    viable, mark = board.propagate()
+    assert_true(viable)
+    assert_equals(board.possible_values(0, 2), [3, 4])
+    assert_equals(board.possible_values(1, 0), [3, 4])
+    board.undo_changes(mark)
+    assert_equals(board.possible_values(0, 2), [1, 2, 3, 4])
+
+    # Propagation must never remove a cell's value in the solution
+    puzzle = '4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......'
+    solution = '417369825632158947958724316825437169791586432346912758289643571573291684164875293'
+    board = Grid(9, 3, 3)
+    for i, value in enumerate(puzzle):
+        board.assign(i // 9, i % 9, 0 if value == '.' else int(value))
+    assert_true(board.propagate()[0])
+    for i, value in enumerate(solution):
+        assert_true(board.is_possible_value(i // 9, i % 9, int(value)))
+    assert_true(sum(board.domain_sizes[i] for i in xrange(81) if not board.tokens[i]) < 100)
+
+    # A value with no place left in a unit is detected
+    board = Grid(4, 2, 2)
+    for y in xrange(4):
+        board.eliminate(0, y, 4)
+    assert_false(board.propagate()[0])
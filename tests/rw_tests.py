@@ -0,0 +1,75 @@
+import os
+import tempfile
+from nose.tools import *
+from src.rw import *
+
+
+def write_temp(f_str):
+    fd, file_path = tempfile.mkstemp(suffix='.txt')
+    with os.fdopen(fd, 'w') as f:
+        f.write(f_str)
+    return file_path
+
+
+def test_iter_puzzles():
+    default = "4 2 2\n1 0 0 0\n0 0 3 0\n0 4 0 0\n0 0 0 2"
+    inline = "1...." + "." * 11
+    file_path = write_temp('\n'.join((default, '', inline, default, inline)) + '\n')
+    try:
+        puzzles = iter_puzzles(file_path)
+        assert_equal(next(puzzles), (1, default))
+        assert_equal(list(puzzles), [(7, inline), (8, default), (13, inline)])
+    finally:
+        os.remove(file_path)
+
+
+def test_open_output_file():
+    file_path = write_temp('existing')
+    root, ext = os.path.splitext(file_path)
+    try:
+        f = open_output_file(file_path)
+        f.write('new')
+        f.close()
+        assert_equal(f.name, root + ' (1)' + ext)
+        assert_equal(read_file(file_path), 'existing')
+        assert_equal(read_file(f.name), 'new')
+    finally:
+        for path in (file_path, root + ' (1)' + ext):
+            if os.path.isfile(path):
+                os.remove(path)
+
+
+def test_puzzle_cells():
+    assert_equal(puzzle_cells('1.3..2.4...3..1.'),
+                 (4, 2, 2, [1, 0, 3, 0, 0, 2, 0, 4, 0, 0, 0, 3, 0, 0, 1, 0]))
+    assert_equal(puzzle_cells('2 1 2\n1 0\n0 0'), (2, 1, 2, [1, 0, 0, 0]))
+    assert_raises(ValueError, puzzle_cells, '1.3..2.4...3..1')
+    assert_equal(puzzle_str(4, 2, 2, [0] * 15 + [4]), '.' * 15 + '4')
+    assert_equal(puzzle_str(6, 3, 2, [0] * 36), '6 3 2\n' + '\n'.join(['0 0 0 0 0 0'] * 6))
+
+
+def test_packed_puzzles():
+    puzzles = ['52...6.........7.13...........4..8..6......5...........418.........3..2...87.....',
+               '.' * 255 + 'G',
+               '6 3 2\n' + '\n'.join(['0 0 0 0 0 0'] * 5 + ['1 2 3 4 5 6'])]
+    text_path = write_temp('\n'.join(puzzles + ['1.3..2.4...3..1']))
+    packed_path = text_path + '.sdk'
+    try:
+        assert_equal(text_to_packed(text_path, packed_path, OVERWRITE), 3)
+        assert_true(is_packed_file(packed_path))
+        assert_false(is_packed_file(text_path))
+        packed = PackedPuzzles(packed_path)
+        assert_equal(len(packed), 3)
+        assert_equal(packed[1], puzzles[1])
+        assert_equal(packed[-1], puzzles[2])
+        assert_equal(list(packed), puzzles)
+        assert_equal(os.path.getsize(packed_path), 18 + (6 + 41) + (6 + 160) + (6 + 14) + 3 * 8)
+        assert_raises(IndexError, packed.cells, 3)
+        packed.close()
+
+        assert_equal(packed_to_text(packed_path, text_path, OVERWRITE), 3)
+        assert_equal(read_file(text_path), '\n'.join(puzzles))
+    finally:
+        for path in (text_path, packed_path):
+            if os.path.isfile(path):
+                os.remove(path)
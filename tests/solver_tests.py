@@ -1,3 +1,4 @@
+import sys
 from nose.tools import *
 from src.solver import *
 
@@ -89,4 +90,111 @@ def test_puzzle_list():
 0 9 3 2 4 0 0 7 5
 0 0 0 0 0 0 0 5 8
 2 3 0 0 0 7 0 0 0
-9 4 0 0 0 2 6 0 0"""])
\ No newline at end of file
+9 4 0 0 0 2 6 0 0"""])
+
+def test_order_values_lcv():
+    board = create_board('4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......')
+    board.forward_check(0, 0, 4)
+    board.forward_check(0, 6, 8)
+    board.assign(0, 1, 1)
+    board.forward_check(0, 1, 1)
+    board.eliminate(1, 1, 2)
+    for row in xrange(board.N):
+        for col in xrange(board.N):
+            if board.cell_empty(row, col):
+                assert_equals(order_values_lcv(board, row, col), order_values_lcv2(board, row, col))
+
+
+def test_solver_instances():
+    puzzle = '..3.2.6..9..3.5..1..18.64....81.29..7.......8..67.82....26.95..8..2.3..9..5.1.3..'
+    fc_solver = Solver(fc=True, mrv=True, dh=False, lcv=False, acp=False, ac=False, time_limit=0)
+    bt_solver = Solver(fc=False, mrv=False, dh=False, lcv=False, acp=False, ac=False, time_limit=0)
+    copy_solver = Solver(**fc_solver.configuration())
+
+    for solver in (fc_solver, bt_solver, copy_solver):
+        board = solver.solve(create_board(puzzle))
+        assert_true(board.solved())
+        assert_false(solver.timeout)
+
+    assert_equals(copy_solver.assignment_count, fc_solver.assignment_count)
+    assert_not_equal(bt_solver.assignment_count, fc_solver.assignment_count)
+
+    assert_raises(TypeError, Solver, forward_checking=True)
+
+
+def test_backtrack_depth():
+    # Filling an empty 16x16 board takes 256 nested choices, which must not hit the recursion limit
+    board = create_board('16 4 4\n' + '\n'.join(' '.join(['0'] * 16) for row in xrange(16)))
+    solver = Solver(fc=True, mrv=True, dh=False, lcv=False, acp=False, ac=False, time_limit=0)
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(100)
+    try:
+        board = solver.solve(board)
+    finally:
+        sys.setrecursionlimit(limit)
+    assert_true(board.solved())
+
+
+def test_create_board_inline():
+    board = create_board('1.3..2.4...3..1.')
+    assert_equals((board.N, board.p, board.q), (4, 2, 2))
+    assert_equals(board.cell_value(0, 2), 3)
+    assert_equals(board.cell_value(2, 3), 3)
+    assert_equals(board.inline(), '1.3..2.4...3..1.')
+
+    board = create_board('.' * 143 + 'c')
+    assert_equals((board.N, board.p, board.q), (12, 3, 4))
+    assert_equals(board.cell_value(11, 11), 12)
+
+
+def test_create_board_invalid():
+    cases = [('1.3..2.4...3..1', 1, 'Line 1: no puzzle'),
+             ('1.3..2.4...5..1.', 1, "Line 1: invalid token '5' at column 12"),
+             ('4 2 2\n1 0 0 0\n0 0 3\n0 4 0 0\n0 0 0 2', 10, 'Line 12: expected 4 values'),
+             ('4 2 2\n1 0 0 0\n0 0 3 0\n0 4 0 5\n0 0 0 2', 10, "Line 13: invalid value '5' in column 4"),
+             ('4 2 3\n1 0 0 0', 10, 'Line 10: invalid puzzle parameters'),
+             ('4 2 2\n1 0 0 0\n0 0 3 0', 10, 'Line 12: puzzle ends after 2 of 4 rows')]
+    for board_str, first_line, msg in cases:
+        try:
+            create_board(board_str, first_line)
+        except ValueError as e:
+            assert_true(str(e).startswith(msg), str(e))
+        else:
+            assert_true(False, board_str)
+
+
+def test_solve_puzzles_skips_invalid():
+    puzzles = [(1, '1.3..2.4...3..1.'), (2, '1.3..2.4...3..1'), (3, '4 2 2\n0 0 0 0\n0 0 0 0\n0 0 0 0\n0 0 0 0')]
+    results = list(solve_puzzles(puzzles, Solver(time_limit=0), workers=1))
+    assert_equals(len(results), 2)
+    assert_true(results[0][0].startswith('==Puzzle 1/3=='))
+    assert_true(results[1][0].startswith('==Puzzle 3/3=='))
+
+
+def test_constraint_propagation():
+    puzzle = '4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......'
+    ac_solver = Solver(fc=True, mrv=True, dh=False, lcv=False, acp=True, ac=True, fcp=False, cpp=False, cp=False,
+                       time_limit=0)
+    cp_solver = Solver(fc=True, mrv=True, dh=False, lcv=False, acp=False, ac=False, fcp=False, cpp=True, cp=True,
+                       time_limit=0)
+    ac_board = ac_solver.solve(create_board(puzzle))
+    cp_board = cp_solver.solve(create_board(puzzle))
+    assert_equals(cp_board.inline(), ac_board.inline())
+    assert_true(cp_solver.assignment_count < ac_solver.assignment_count)
+
+
+def test_dlx_engine():
+    puzzle = '4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......'
+    solution = '417369825632158947958724316825437169791586432346912758289643571573291684164875293'
+    solver = Solver(engine='dlx', time_limit=0)
+    board = solver.solve(create_board(puzzle))
+    assert_equals(board.inline(), solution)
+    assert_true(solver.assignment_count >= puzzle.count('.'))
+    assert_false(solver.timeout)
+
+    assert_equals(solver.solve(create_board('1.3..2.4...3..1.')), None)
+    assert_equals(solver.solve(create_board('11..............')), None)
+
+    unsolved_puzzle_str, solution_str, data_entry = solver.solve_puzzle('.' * 16, display=False)
+    assert_true(data_entry[4])
+    assert_equals(data_entry[3], 16)
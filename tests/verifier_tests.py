@@ -130,4 +130,16 @@ asdfb
         assert_true(board_inline(case))
 
     for case in test_strings_failing:
-        assert_false(board_inline(case))
\ No newline at end of file
+        assert_false(board_inline(case))
+
+def test_board_inline_large():
+    puzzle16 = ('.63B.EC..A..8....847..A6..B....9.....81.D.G...7E.......7..98...CF.D.....AC..2.......D.....E1..5.CE'
+                '......6...GF.31A.9...B8G7.4..D2.E...45....69.F.7......E..A...5..94..6......D.....63..F79.5...A....E6'
+                '.D.1...2.8...3G.FA56.......D.C...9...B1.6..2..B.5C9.....34')
+    assert_true(board_inline(puzzle16))
+    assert_true(board_inline('2.4.' * 4))  # 4x4 puzzle
+    assert_true(board_inline(puzzle16 + '\n' + '52...6.........7.13...........4..8..6......5...........418.........3..2...87.....'))
+
+    assert_false(board_inline(puzzle16.replace('G', 'H')))  # H is not a token of a 16x16 puzzle
+    assert_false(board_inline('2.5.' * 4))
+    assert_false(board_inline(puzzle16[:-1]))